@@ -0,0 +1,105 @@
+import numpy as np
+from branca.colormap import StepColormap, linear
+
+METHODES = {
+    "linear": "Intervalles égaux",
+    "quantile": "Quantiles",
+    "natural": "Seuils naturels",
+}
+CLASSES = 9
+PALETTE = linear.OrRd_09
+VIDE = "lightgray"
+
+
+def bornes_lineaires(valeurs, classes):
+    return np.linspace(valeurs.min(), valeurs.max(), classes + 1)
+
+
+def bornes_quantiles(valeurs, classes):
+    return np.quantile(valeurs, np.linspace(0, 1, classes + 1))
+
+
+def bornes_naturelles(valeurs, classes):
+    # seuils naturels (Fisher-Jenks) : programmation dynamique minimisant la
+    # somme des variances intra-classes, coûts d'intervalle tirés des sommes
+    # cumulées, chaque ligne du tableau calculée d'un bloc
+    x = np.sort(valeurs)
+    n = len(x)
+    s1 = np.concatenate([[0.0], np.cumsum(x)])
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+
+    def ecart(debut, fin):
+        # somme des carrés des écarts de x[debut:fin]
+        return s2[fin] - s2[debut] - (s1[fin] - s1[debut]) ** 2 / (fin - debut)
+
+    cout = np.full(n + 1, np.inf)
+    cout[1:] = ecart(0, np.arange(1, n + 1))
+    choix = np.zeros((classes, n + 1), dtype=int)
+    for j in range(1, classes):
+        suivant = np.full(n + 1, np.inf)
+        for fin in range(j + 1, n + 1):
+            debuts = np.arange(j, fin)
+            total = cout[debuts] + ecart(debuts, fin)
+            m = np.argmin(total)
+            suivant[fin] = total[m]
+            choix[j, fin] = debuts[m]
+        cout = suivant
+    bornes = [x[-1]]
+    fin = n
+    for j in range(classes - 1, 0, -1):
+        fin = choix[j, fin]
+        bornes.append(x[fin - 1])
+    bornes.append(x[0])
+    return np.array(bornes[::-1])
+
+
+BORNES = {
+    "linear": bornes_lineaires,
+    "quantile": bornes_quantiles,
+    "natural": bornes_naturelles,
+}
+
+
+class Classification:
+    # classes d'un indicateur calculées une fois : bornes, couleur de chaque
+    # classe et table identifiant -> couleur lue directement par la couche
+    # folium. Les valeurs nulles ou absentes restent hors classes (VIDE)
+    def __init__(self, codes, valeurs, methode="linear", classes=CLASSES):
+        valeurs = np.asarray(valeurs, dtype=float)
+        positifs = valeurs > 0
+        x = valeurs[positifs]
+        if len(x):
+            classes = min(classes, len(np.unique(x)))
+            bornes = np.unique(BORNES[methode](x, classes))
+            if len(bornes) < 2:
+                bornes = np.array([x.min(), x.max()])
+        else:
+            bornes = np.array([0.0, 0.0])
+        self.bornes = bornes
+        self.couleurs_classes = [
+            PALETTE.rgb_hex_str(t)
+            for t in np.linspace(PALETTE.vmin, PALETTE.vmax, len(bornes) - 1)
+        ]
+        classe = np.searchsorted(bornes[1:-1], valeurs, side="left")
+        couleurs = np.where(positifs, np.array(self.couleurs_classes)[classe], VIDE)
+        self.couleurs = dict(zip(codes, couleurs.tolist()))
+
+    def style(self, feature, cle="code"):
+        couleur = self.couleurs.get(feature["properties"][cle], VIDE)
+        vide = couleur == VIDE
+        return {
+            "fillColor": couleur,
+            "fillOpacity": 0 if vide else 0.9,
+            "weight": 0 if vide else 1,
+            "color": "gray",
+        }
+
+    def legende(self, facteur=1, caption=""):
+        bornes = self.bornes / facteur
+        return StepColormap(
+            self.couleurs_classes,
+            index=bornes.tolist(),
+            vmin=bornes[0],
+            vmax=bornes[-1],
+            caption=caption,
+        )
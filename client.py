@@ -0,0 +1,177 @@
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEO_API_URL = os.environ.get("GEO_API_URL", "https://geo.api.gouv.fr")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class GeoClient:
+    # client HTTP partagé par toutes les sessions : connexions keep-alive,
+    # timeouts, reprises bornées, disjoncteur, nombre de requêtes simultanées
+    # limité et cache des réponses
+    def __init__(
+        self,
+        base_url=GEO_API_URL,
+        timeout=(3.05, 10),
+        retries=2,
+        backoff=0.5,
+        max_in_flight=8,
+        failure_threshold=5,
+        reset_after=30,
+        cache_size=4096,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.cache_size = cache_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="geo-prefetch"
+        )
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._failures = 0
+        self._opened_at = None
+        self._latencies = deque(maxlen=1000)
+        self._counters = dict.fromkeys(
+            ["hits", "misses", "requests", "errors", "retries", "rejected"], 0
+        )
+
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get_json(self, path):
+        url = self.url(path)
+        with self._lock:
+            if url in self._cache:
+                self._cache.move_to_end(url)
+                self._counters["hits"] += 1
+                return self._cache[url]
+            self._counters["misses"] += 1
+        result = self._fetch(url)
+        if result is not None:
+            self.put(url, result)
+        return result
+
+    def put(self, path, result):
+        url = self.url(path)
+        with self._lock:
+            self._cache[url] = result
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cached(self, path):
+        with self._lock:
+            return self.url(path) in self._cache
+
+    def prefetch(self, paths):
+        # chargement en tâche de fond : une requête en cours n'est pas relancée
+        futures = []
+        with self._lock:
+            for path in paths:
+                url = self.url(path)
+                if url not in self._pending:
+                    self._pending[url] = self._executor.submit(self._prefetch, url)
+                futures.append(self._pending[url])
+        return futures
+
+    def _prefetch(self, url):
+        try:
+            return self.get_json(url)
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def circuit_open(self):
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                # semi-ouvert : on laisse passer une requête de test
+                self._opened_at = None
+                self._failures = self.failure_threshold - 1
+                return False
+            return True
+
+    def _fetch(self, url):
+        if self.circuit_open():
+            self._count("rejected")
+            return None
+        if not self._slots.acquire(timeout=sum(self.timeout)):
+            self._count("rejected")
+            return None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self._count("retries")
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                start = time.perf_counter()
+                try:
+                    self._count("requests")
+                    response = self.session.get(url, timeout=self.timeout)
+                except requests.RequestException:
+                    continue
+                finally:
+                    with self._lock:
+                        self._latencies.append(time.perf_counter() - start)
+                if response.status_code == 200:
+                    self._success()
+                    try:
+                        return response.json()
+                    except ValueError:
+                        return None
+                if response.status_code not in RETRY_STATUS:
+                    self._success()
+                    return None
+            self._failure()
+            return None
+        finally:
+            self._slots.release()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _success(self):
+        with self._lock:
+            self._failures = 0
+
+    def _failure(self):
+        with self._lock:
+            self._counters["errors"] += 1
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = dict(self._counters)
+            metrics["cached"] = len(self._cache)
+            metrics["circuit_open"] = self._opened_at is not None
+        if latencies:
+            metrics["latency_mean"] = statistics.fmean(latencies)
+            metrics["latency_p50"] = latencies[len(latencies) // 2]
+            metrics["latency_p95"] = latencies[int(len(latencies) * 0.95)]
+        return metrics
@@ -0,0 +1,724 @@
+# éléments communs aux deux applications : accès aux données (base, cube,
+# geo API), graphiques, onglet AAV, fiche département, onglet national,
+# exports et profilage
+import json
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from client import GeoClient
+from db import QueryCache, open_backend
+from export import FORMATS, flux
+from geo import GeoReference, geojson_path
+from store import (
+    ZONE_NATIONALE,
+    RollupCube,
+    TerritoryHierarchy,
+    compacte,
+    fige_json,
+    derive,
+    fige,
+    format_val,
+    masque_secret,
+)
+from tracing import aplatir, span, traced
+
+
+@st.cache_resource
+def db():
+    # SQLite ou fichiers Arrow + DuckDB selon TDC_BACKEND
+    return open_backend()
+
+
+@st.cache_resource
+def queries():
+    return QueryCache(db())
+
+
+@st.cache_resource
+def geo_client():
+    return GeoClient()
+
+
+def ask(path):
+    with span("ask", path=path) as noeud:
+        noeud["cache"] = "hit" if geo_client().cached(path) else "miss"
+        return geo_client().get_json(path)
+
+
+def format_dep(departement):
+    return departement.lstrip("0").zfill(2)
+
+
+PERIMETRES = ["200m", "1000m", "10000m"]
+
+
+@traced(cache=st.cache_resource)
+def cube():
+    # une seule instance, en lecture seule, partagée par toutes les sessions :
+    # communes, départements et national de chaque périmètre
+    communes = {
+        p: db().table(f"indicateurs_com_{p}", dtype={"idcom": str, "iddep": str})
+        for p in PERIMETRES
+    }
+    departements = {
+        p: db().table(f"indicateurs_dpt_{p}", dtype={"iddep": str}) for p in PERIMETRES
+    }
+    national = db().table("indicateurs_national")
+    for df in [*communes.values(), *departements.values()]:
+        df["iddep"] = df["iddep"].apply(format_dep)
+    national = {f"{seuil}m": df for seuil, df in national.groupby("seuil_frange")}
+    return RollupCube(
+        communes,
+        departements,
+        national,
+        prepare=lambda df: fige(derive(compacte(df))),
+    )
+
+
+def data(perimetre):
+    return cube().frame(perimetre, "idcom")
+
+
+def data_dep(perimetre):
+    return cube().frame(perimetre, "iddep")
+
+
+def indicateurs(perimetre, id="idcom"):
+    return cube().store(perimetre, id)
+
+
+def get_vals(values, code, perimetre, id="idcom"):
+    return indicateurs(perimetre, id).values(values, code)
+
+
+def gets(values, code, perimetre, id="idcom"):
+    return indicateurs(perimetre, id).textes(values, code)
+
+
+@st.cache_resource
+def geo_reference():
+    # communes.geojson facultatif : contours des communes absents servis par
+    # la geo API
+    return GeoReference.from_files(
+        "departement.geojson", "communes.geojson", "aav.geojson"
+    )
+
+
+@traced(cache=st.cache_resource)
+def hierarchie(perimetre):
+    reference = geo_reference()
+    departements = {d["code"]: d["nom"] for d in reference.departements()}
+    return TerritoryHierarchy(data(perimetre), departements, reference.nom_commune)
+
+
+def enregistre_trace(arbre):
+    traces = st.session_state.setdefault("traces", [])
+    traces.append(arbre)
+    del traces[:-20]
+
+
+def profilage():
+    # panneau d'administration, activé par le secret "profilage"
+    if not st.secrets.get("profilage", False):
+        return
+    with st.sidebar:
+        if not st.toggle("Profilage", key="profilage"):
+            return
+        traces = st.session_state.get("traces", [])
+        if not traces:
+            return
+        st.subheader("Derniers reruns")
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {"rerun": t["nom"], "ms": t["ms"], "spans": len(list(aplatir(t)))}
+                    for t in reversed(traces)
+                ]
+            ),
+            hide_index=True,
+        )
+        st.subheader(f"Détail - {traces[-1]['nom']}")
+        st.dataframe(pd.DataFrame(list(aplatir(traces[-1]))), hide_index=True)
+        st.subheader("geo API")
+        st.json(geo_client().metrics())
+
+
+ZOOM_AAV = 5
+
+
+@traced(cache=st.cache_resource)
+def data_aav(zoom=ZOOM_AAV):
+    with open(geojson_path("aav.geojson", zoom), encoding="utf-8") as response:
+        aav = json.load(response)
+    for a in aav["features"]:
+        a["id"] = a["properties"]["id"]
+    return fige_json(aav)
+
+
+def carto_aav(ratio, perimetre):
+    # signature de la base dans la clé : figure recalculée quand le fichier
+    # change, comme les résultats de QueryCache
+    return _carto_aav(ratio, perimetre, queries().signature())
+
+
+@traced("carto_aav", cache=st.cache_data)
+def _carto_aav(ratio, perimetre, signature):
+    seuil = perimetre[:-1]
+    aav = data_aav()
+    df = queries().run("aav_ratio", {"seuil": int(seuil)}, ratio=ratio)
+
+    fig = px.choropleth_mapbox(
+        df,
+        geojson=aav,
+        locations="aav2020",
+        color="base_100",
+        color_continuous_scale="tropic",
+        range_color=(50, 150),
+        mapbox_style="carto-positron",
+        zoom=ZOOM_AAV,
+        center={"lat": 50, "lon": 3},
+        opacity=0.7,
+        # mapbox_style="open-street-map",
+        hover_name="libaav2020",
+        labels={"base_100": "Pourcentage", "aav2020": "Code AAV"},
+    )
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
+
+
+# rendu d'une figure plotly (sérialisation comprise), mesuré comme un calcul
+plotly_chart = traced("plotly_chart")(st.plotly_chart)
+
+
+@traced()
+def graphe_aav(type, perimetre):
+    seuil = perimetre[:-1]
+    df = queries().run("aav_evolution", {"seuil": int(seuil)}, type=type)
+    fig = px.scatter(df, y="libaav2020", x="base_100", color="annee")
+    fig.add_vrect(
+        x0="100",
+        x1="200",
+        annotation_text="Valeurs foncières supérieures au sein la bande",
+        annotation_position="top left",
+        fillcolor="tomato",
+        opacity=0.25,
+        line_width=0,
+    )
+    fig.update_layout(height=4000)
+    fig.update_layout(
+        title_text="Situation des prix des dans la bande par rapport à l'AAV"
+    )
+    return fig
+
+
+@traced()
+def taux_rotation(perimetre):
+    seuil = perimetre[:-1]
+    return queries().run("taux_rotation", {"seuil": int(seuil)})
+
+
+@traced()
+def onglet_aav(perimetre):
+    st.header("Aires d'attraction des villes")
+
+    with st.expander("Précisions"):
+        st.write(
+            """
+        Les indicateurs de comparaison de marchés à l'AAV 
+        concernent uniquement les bandes des communes 
+        en bord de mer au sens de la loi littorale.
+                     """
+        )
+
+    st.subheader("Comparaison des niveaux de prix en 2021")
+
+    st.markdown(
+        """
+        Pour les maisons moyennes et les appartements 3/4 pièces,
+        une comparaison du prix médian dans la bande littorale par rapport 
+        au prix médian dans chaque territoire de référence (Aire d'Attration des Villes)
+        est proposée."""
+    )
+
+    with st.spinner("Chargement..."):
+        col_carto_aav_mai, col_carto_aav_apt = st.columns(2)
+        with col_carto_aav_mai:
+            st.subheader("Maisons moyennes (90-130 m2)")
+            plotly_chart(
+                carto_aav("valeur_ratio_2021_maison", perimetre),
+                use_container_width=True,
+            )
+        with col_carto_aav_apt:
+            st.subheader("Appartements 3/4 pièces")
+            plotly_chart(
+                carto_aav("valeur_ratio_2021_appt", perimetre),
+                use_container_width=True,
+            )
+
+    st.markdown(
+        """
+        *Interprétation : si le ratio calculé à 200 m vaut 122 % 
+        pour les maisons moyennes de l'AAV de Vannes, cela signifie, que les
+        biens situés dans la zone littorale des 200 m sur cette AAV sont 1,22 fois 
+        plus chers que ceux du même AAV à l'extérieur de cette zone.*
+        """
+    )
+
+    st.subheader("Evolution des niveaux de prix par AAV de 2015 à 2021")
+
+    with st.spinner("Chargement..."):
+        col_graphe_aav_mai, col_graphe_aav_apt = st.columns(2)
+        with col_graphe_aav_mai:
+            st.subheader("Maisons moyennes (90-130 m2)")
+            plotly_chart(graphe_aav("maison", perimetre), use_container_width=True)
+        with col_graphe_aav_apt:
+            st.subheader("Appartements 3/4 pièces")
+            plotly_chart(graphe_aav("appt", perimetre), use_container_width=True)
+
+    st.subheader("Taux de rotation du parc privé")
+    st.markdown(
+        """
+        Les taux de rotation proposés correspondent au nombre de logements privés ayant muté entre 2019 et 2021 
+        divisé par la taille du parc de logements privés en 2019 dans les zones concernées et non concernées.  
+        """
+    )
+
+    st.dataframe(taux_rotation(perimetre), use_container_width=True)
+    telechargement({"AAV": (f"aav_{perimetre}", lambda: donnees_aav(perimetre))}, "aav")
+
+
+def telechargement(exports, cle):
+    # exports : {libellé: (nom de fichier, fonction renvoyant le DataFrame)} ;
+    # le fichier n'est produit qu'au clic, morceau par morceau, secret appliqué
+    with st.expander("Télécharger les données"):
+        col_donnees, col_format, col_bouton = st.columns(
+            [0.5, 0.25, 0.25], vertical_alignment="bottom"
+        )
+        with col_donnees:
+            libelle = st.selectbox("Données", list(exports), key=f"export_{cle}")
+        with col_format:
+            format = st.selectbox("Format", list(FORMATS), key=f"format_{cle}")
+        nom, donnees = exports[libelle]
+        extension, mime = FORMATS[format]
+        with col_bouton:
+            st.download_button(
+                "Télécharger",
+                data=lambda: flux(donnees(), extension),
+                file_name=f"{nom}.{extension}",
+                mime=mime,
+                on_click="ignore",
+                key=f"telecharger_{cle}",
+            )
+
+
+def extrait_communes(perimetre, codes=None, departements=None):
+    df = data(perimetre)
+    if codes is not None:
+        df = df[df["idcom"].isin(codes)]
+    if departements is not None:
+        df = df[df["iddep"].isin(departements)]
+    return df
+
+
+def exports_departement(code_dep, perimetre, id):
+    if id == "zone":
+        return {
+            "Toutes les communes": (
+                f"communes_{perimetre}",
+                lambda: extrait_communes(perimetre),
+            ),
+            "Tous les départements": (
+                f"departements_{perimetre}",
+                lambda: data_dep(perimetre),
+            ),
+            "National": (
+                f"national_{perimetre}",
+                lambda: cube().frame(perimetre, "zone"),
+            ),
+        }
+    return {
+        "Communes du département": (
+            f"communes_{code_dep}_{perimetre}",
+            lambda: extrait_communes(perimetre, departements=[code_dep]),
+        ),
+        "Département": (
+            f"departement_{code_dep}_{perimetre}",
+            lambda: data_dep(perimetre)[data_dep(perimetre)["iddep"] == code_dep],
+        ),
+        "Tous les départements": (
+            f"departements_{perimetre}",
+            lambda: data_dep(perimetre),
+        ),
+    }
+
+
+def donnees_aav(perimetre):
+    df = db().table("indicateurs_aav", dtype={"aav2020": str})
+    return df[df["seuil_frange"] == int(perimetre[:-1])]
+
+
+COMPARAISON_PERIMETRES = {
+    "nb_logt": "Logements",
+    "estim_logt": "Estimation des logements (€)",
+    "nb_loc_act": "Locaux d'activité",
+    "estim_bur_com": "Estimation bureaux/commerces (€)",
+    "surfaces_urba": "Surface urbanisée (m2)",
+    "surfaces_naf": "Surface NAF (m2)",
+}
+
+
+@traced()
+def onglet_national(perimetre):
+    with st.expander("Précisions"):
+        st.write(
+            """
+        Les données nationales cumulent les départements littoraux : elles
+        concernent uniquement les communes en bord de mer au sens de la loi
+        littorale.
+                     """
+        )
+    for ecart in cube().ecarts:
+        st.warning(f"Cumul à vérifier : {ecart}")
+    fiche_departement(ZONE_NATIONALE, "France littorale", perimetre, "zone")
+
+
+def comparaison_bandes(code, id="idcom"):
+    # une seule plage de la table longue : les trois bandes du territoire
+    df = cube().tranche(id, code, colonnes=list(COMPARAISON_PERIMETRES))
+    textes = {
+        libelle: [format_val(valeur) for valeur in masque_secret(df[col])]
+        for col, libelle in COMPARAISON_PERIMETRES.items()
+    }
+    bandes = df.index.get_level_values("perimetre")
+    st.header("Comparaison des bandes")
+    st.dataframe(
+        pd.DataFrame(textes, index=[f"Bande {p}" for p in bandes]),
+        use_container_width=True,
+    )
+
+
+PERIODES_CONSTRUCTION = ["", "_av45", "_45_59", "_60_74", "_75_97", "_98_12", "_ap12"]
+
+
+INDICATEURS_CHIFFRES = [
+    "nb_logt",
+    "estim_logt",
+    "surfaces_urba",
+    "nb_loc_act",
+    "estim_bur_com",
+    "surfaces_naf",
+    "nb_hotels",
+    "nb_campings",
+    "nb_commerces",
+    "nb_bureaux",
+    "nb_act_autres",
+    "estim_maisons",
+    "estim_appts",
+    "estim_loyer_loue",
+    "estimation_bureaux",
+    "estimation_commerces",
+]
+
+
+@traced()
+def graphe_occupation_parc(code_insee, perimetre, id="idcom"):
+    type_occupation = [
+        "Total",
+        "Occupés par propriétaire",
+        "Loué",
+        "Résidences secondaires",
+        "Vacants",
+    ]
+    valeurs = gets(
+        ["nb_logt", "nb_logt_po", "nb_logt_pb", "nb_logt_rs", "nb_logt_va"],
+        code_insee,
+        perimetre,
+        id=id,
+    )
+    fig = go.Figure([go.Bar(x=type_occupation, y=valeurs)])
+    fig.update_layout(
+        title_text="Nombre de logements concernés en fonction de leur occupation"
+    )
+    return fig
+
+
+@traced()
+def graphe_age_parc(code_insee, perimetre, id="idcom"):
+    type_occupation = [
+        "Total",
+        "Avant 1945",
+        "1945-1959",
+        "1960-1974",
+        "1975-1997",
+        "1998-2012",
+        "Après 2012",
+    ]
+    valeurs_maison = gets(
+        [f"nb_maisons{suffixe}" for suffixe in PERIODES_CONSTRUCTION],
+        code_insee,
+        perimetre,
+        id=id,
+    )
+    valeurs_appartement = gets(
+        [f"nb_appts{suffixe}" for suffixe in PERIODES_CONSTRUCTION],
+        code_insee,
+        perimetre,
+        id=id,
+    )
+    fig = go.Figure(
+        [
+            go.Bar(x=type_occupation, y=valeurs_maison, name="Maison"),
+            go.Bar(x=type_occupation, y=valeurs_appartement, name="Appartements"),
+        ]
+    )
+    fig.update_layout(
+        title_text="Nombre de logements concernés en fonction de leur période de construction"
+    )
+    return fig
+
+
+@traced()
+def graphe_foncier(code_insee, perimetre, id="idcom"):
+    labels = ["Surfaces NAF", "Surface urbanisées"]
+    values = get_vals(["surfaces_naf", "surfaces_urba"], code_insee, perimetre, id=id)
+    fig = go.Figure(data=[go.Pie(labels=labels, values=values)])
+    return fig
+
+
+@traced()
+def graphe_estimation_logement_taille(code_insee, perimetre, id="idcom"):
+    data = dict(
+        typo=[
+            "Maison",
+            "Maison",
+            "Maison",
+            "Appartement",
+            "Appartement",
+            "Appartement",
+        ],
+        taille=[
+            "Petite",
+            "Moyenne",
+            "Grande",
+            "Petit",
+            "Moyen",
+            "Grand",
+        ],
+        estimation=get_vals(
+            [
+                "estim_maisons_petites",
+                "estim_maisons_moyennes",
+                "estim_maisons_grandes",
+                "estim_appts_petits",
+                "estim_appts_moyens",
+                "estim_appts_grands",
+            ],
+            code_insee,
+            perimetre,
+            id=id,
+        ),
+    )
+    df = pd.DataFrame.from_dict(data)
+    fig = px.sunburst(
+        df,
+        path=["typo", "taille"],
+        values="estimation",
+        # title="Estimation financière des logements selon leur taille",
+    )
+    fig.update_traces(textinfo="label+percent entry")
+    return fig
+
+
+@traced()
+def graphe_estimation_logement_age(code_insee, perimetre, id="idcom"):
+    data = dict(
+        typo=[
+            "Maison",
+            "Maison",
+            "Maison",
+            "Maison",
+            "Maison",
+            "Maison",
+            "Appartement",
+            "Appartement",
+            "Appartement",
+            "Appartement",
+            "Appartement",
+            "Appartement",
+        ],
+        taille=[
+            "Avant 1945",
+            "1945-1959",
+            "1960-1974",
+            "1975-1997",
+            "1998-2012",
+            "Après 2012",
+            "Avant 1945",
+            "1945-1959",
+            "1960-1974",
+            "1975-1997",
+            "1998-2012",
+            "Après 2012",
+        ],
+        estimation=get_vals(
+            [f"estim_maisons{suffixe}" for suffixe in PERIODES_CONSTRUCTION[1:]]
+            + [f"estim_appts{suffixe}" for suffixe in PERIODES_CONSTRUCTION[1:]],
+            code_insee,
+            perimetre,
+            id=id,
+        ),
+    )
+    df = pd.DataFrame.from_dict(data)
+    fig = px.sunburst(
+        df,
+        path=["typo", "taille"],
+        values="estimation",
+        # title="Estimation financière des logements selon leur taille",
+    )
+    fig.update_traces(textinfo="label+percent entry")
+    return fig
+
+
+def fiche_departement(code_dep, departement_dep, perimetre, id="iddep"):
+    chiffres = dict(
+        zip(
+            INDICATEURS_CHIFFRES,
+            gets(INDICATEURS_CHIFFRES, code_dep, perimetre, id),
+        )
+    )
+
+    with st.spinner("Chargement..."):
+        st.header(f"{departement_dep} - Bande {perimetre}")
+        col21, col22 = st.columns(2)
+        with col21:
+            st.metric(
+                "Nombre de logements",
+                chiffres["nb_logt"],
+            )
+            st.metric(
+                "Estimation des logements",
+                chiffres["estim_logt"] + " €",
+            )
+            st.metric(
+                "Surface urbanisée",
+                chiffres["surfaces_urba"] + " m2",
+            )
+        with col22:
+            st.metric(
+                "Nombre de locaux d'activité",
+                chiffres["nb_loc_act"],
+            )
+            st.metric(
+                "Estimation bureaux/commerces",
+                chiffres["estim_bur_com"] + " €",
+            )
+            st.metric(
+                "Surface NAF",
+                chiffres["surfaces_naf"] + " m2",
+            )
+
+    st.header("Enjeux concernées")
+
+    with st.spinner("Chargement..."):
+        st.subheader("Logement")
+        col_occ_dep, col_cstr_dep = st.columns(2, gap="large")
+        with col_occ_dep:
+            plotly_chart(
+                graphe_occupation_parc(code_dep, perimetre, id),
+                use_container_width=True,
+            )
+        with col_cstr_dep:
+            plotly_chart(
+                graphe_age_parc(code_dep, perimetre, id),
+                use_container_width=True,
+            )
+
+        col_foncier_dep, col_act_dep = st.columns(2, gap="large")
+        with col_foncier_dep:
+            st.subheader("Foncier")
+            plotly_chart(
+                graphe_foncier(code_dep, perimetre, id),
+                use_container_width=True,
+            )
+        with col_act_dep:
+            st.subheader("Activité")
+            col_hotel_dep, col_camping_dep = st.columns(2)
+            with col_hotel_dep:
+                st.metric(
+                    "Hotels",
+                    chiffres["nb_hotels"],
+                )
+            with col_camping_dep:
+                st.metric(
+                    "Campings",
+                    chiffres["nb_campings"],
+                )
+
+            col_commerce_dep, col_bureau_dep = st.columns(2)
+            with col_commerce_dep:
+                st.metric(
+                    "Commerces",
+                    chiffres["nb_commerces"],
+                )
+            with col_bureau_dep:
+                st.metric(
+                    "Locaux de bureau",
+                    chiffres["nb_bureaux"],
+                )
+
+            st.metric(
+                "Autres locaux d'activité",
+                chiffres["nb_act_autres"],
+            )
+
+    st.header("Estimation des biens")
+
+    with st.spinner("Chargement..."):
+        st.subheader("Estimation des logements")
+        col_estim_dep, col_mai_dep, col_apt_dep, col_loyer_dep = st.columns(
+            4, gap="large"
+        )
+        with col_estim_dep:
+            st.metric(
+                "Ensemble des logements",
+                chiffres["estim_logt"] + " €",
+            )
+        with col_mai_dep:
+            st.metric(
+                "Maisons",
+                chiffres["estim_maisons"] + " €",
+            )
+        with col_apt_dep:
+            st.metric(
+                "Appartements",
+                chiffres["estim_appts"] + " €",
+            )
+        with col_loyer_dep:
+            st.metric(
+                "Estimation des loyers percus",
+                chiffres["estim_loyer_loue"] + " €/mois",
+            )
+
+        plotly_chart(
+            graphe_estimation_logement_taille(code_dep, perimetre, id),
+            use_container_width=True,
+        )
+
+        st.subheader("Estimation des locaux d'activité")
+        col_estim_bureau_dep, col_estim_commerce_dep = st.columns(2, gap="large")
+        with col_estim_bureau_dep:
+            st.metric(
+                "Bureaux",
+                chiffres["estimation_bureaux"] + " €",
+            )
+        with col_estim_commerce_dep:
+            st.metric(
+                "Commerces",
+                chiffres["estimation_commerces"] + " €",
+            )
+
+    comparaison_bandes(code_dep, id)
+    telechargement(exports_departement(code_dep, perimetre, id), id)
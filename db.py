@@ -0,0 +1,281 @@
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from store import base_100
+from tracing import span
+
+DB_PATH = "indicateurs_tdc.sqlite3"
+
+# "sqlite" (lecture directe) ou "arrow" (fichiers Arrow projetés en mémoire,
+# requêtes DuckDB)
+BACKEND = os.environ.get("TDC_BACKEND", "sqlite")
+ARROW_DIR = os.environ.get("TDC_ARROW_DIR", "arrow")
+
+# codes lus en texte (zéros en tête), quelle que soit la table
+CODES = ["idcom", "iddep", "aav2020"]
+
+ANNEES_AAV = ["2015", "2018", "2021"]
+TYPES_AAV = ["maison", "appt"]
+
+# identifiants (noms de colonnes) autorisés dans les requêtes : tout le reste
+# passe en paramètre SQL
+IDENTIFIERS = {
+    "ratio": {f"valeur_ratio_{a}_{t}" for a in ANNEES_AAV for t in TYPES_AAV},
+    "type": set(TYPES_AAV),
+}
+
+QUERIES = {
+    "aav_ratio": {
+        "sql": """
+            SELECT aav2020, libaav2020, {ratio} AS ratio
+            FROM indicateurs_aav
+            WHERE seuil_frange = :seuil
+        """,
+        "dtype": {"aav2020": str},
+        "derive": lambda df: df.assign(base_100=base_100(df["ratio"])),
+    },
+    "aav_evolution": {
+        "sql": " UNION ALL ".join(
+            f"""
+            SELECT aav2020, libaav2020, '{annee}' AS annee,
+            valeur_ratio_{annee}_{{type}} AS ratio
+            FROM indicateurs_aav
+            WHERE seuil_frange = :seuil
+            """
+            for annee in ANNEES_AAV
+        )
+        + " ORDER BY aav2020 DESC, annee",
+        "dtype": {"aav2020": str},
+        "derive": lambda df: df.assign(base_100=base_100(df["ratio"])),
+    },
+    "taux_rotation": {
+        "sql": """
+            SELECT libaav2020 AS "Nom AAV",
+                cast(round(tx_rotation_impact * 100.0, 1) As text) || ' %'
+                    AS "Taux rotation dans la zone",
+                cast(round(tx_rotation_non_impact * 100.0, 1) As text) || ' %'
+                    AS "Taux rotation hors zone"
+            FROM indicateurs_aav
+            WHERE seuil_frange = :seuil
+        """,
+    },
+}
+
+
+class ConnectionPool:
+    # connexions SQLite en lecture seule partagées entre les sessions :
+    # chaque connexion n'est utilisée que par un thread à la fois, les
+    # lectures concurrentes ne se bloquent pas entre elles
+    def __init__(self, path=DB_PATH, size=8, mmap_size=256 * 2**20, cache_kb=65536):
+        self.path = path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_kb = cache_kb
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_kb}")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if not create:
+                conn = self._pool.get()
+            else:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def signature(path=DB_PATH):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SqliteBackend:
+    # tables et requêtes lues directement dans la base SQLite
+    def __init__(self, pool):
+        self.pool = pool
+
+    def signature(self):
+        return signature(self.pool.path)
+
+    def table(self, name, dtype=None):
+        with self.pool.connection() as conn:
+            return pd.read_sql_query(f"SELECT * FROM {name}", con=conn, dtype=dtype)
+
+    def query(self, sql, params, dtype=None):
+        with self.pool.connection() as conn:
+            return pd.read_sql_query(sql, con=conn, params=params, dtype=dtype)
+
+
+def materialise(path=DB_PATH, dossier=ARROW_DIR):
+    # une table SQLite -> un fichier Arrow IPC non compressé, projetable en
+    # mémoire tel quel ; la signature de la base source est notée à côté
+    import pyarrow as pa
+
+    os.makedirs(dossier, exist_ok=True)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        noms = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        for (nom,) in noms.fetchall():
+            df = pd.read_sql_query(f'SELECT * FROM "{nom}"', con=conn)
+            df = df.astype({col: str for col in CODES if col in df.columns})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            fichier = os.path.join(dossier, f"{nom}.arrow")
+            with pa.OSFile(fichier + ".tmp", "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(fichier + ".tmp", fichier)
+    finally:
+        conn.close()
+    with open(os.path.join(dossier, "source.json"), "w", encoding="utf-8") as f:
+        json.dump(list(signature(path)), f)
+
+
+class ArrowBackend:
+    # colonnes projetées en mémoire (mmap) depuis les fichiers Arrow, sans
+    # conversion ligne à ligne ; requêtes analytiques (unions, cumuls,
+    # classements) exécutées par DuckDB sur ces mêmes tables Arrow. Les
+    # fichiers sont régénérés si la base SQLite a changé
+    def __init__(self, path=DB_PATH, dossier=ARROW_DIR):
+        import duckdb
+        import pyarrow as pa
+
+        self._pa = pa
+        self.path = path
+        self.dossier = dossier
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._duckdb = duckdb.connect()
+        self._signature = None
+
+    def signature(self):
+        return signature(self.path)
+
+    def _source(self):
+        try:
+            with open(os.path.join(self.dossier, "source.json"), encoding="utf-8") as f:
+                return tuple(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def arrow(self, name):
+        signature = self.signature()
+        with self._lock:
+            if signature != self._signature:
+                if self._source() != signature:
+                    materialise(self.path, self.dossier)
+                self._tables.clear()
+                self._signature = signature
+            if name not in self._tables:
+                fichier = os.path.join(self.dossier, f"{name}.arrow")
+                source = self._pa.memory_map(fichier)
+                self._tables[name] = self._pa.ipc.open_file(source).read_all()
+            return self._tables[name]
+
+    def table(self, name, dtype=None):
+        df = self.arrow(name).to_pandas(split_blocks=True)
+        return df.astype(dtype) if dtype else df
+
+    def query(self, sql, params, dtype=None):
+        # paramètres :nom (syntaxe SQLite) -> $nom (DuckDB) ; chaque requête a
+        # son curseur, les tables Arrow y sont enregistrées sans copie
+        curseur = self._duckdb.cursor()
+        try:
+            for name in set(re.findall(r"\bFROM\s+(\w+)", sql, re.IGNORECASE)):
+                curseur.register(name, self.arrow(name))
+            df = curseur.execute(re.sub(r":(\w+)", r"$\1", sql), params).df()
+        finally:
+            curseur.close()
+        return df.astype(dtype) if dtype else df
+
+
+def open_backend(name=BACKEND, path=DB_PATH):
+    if name == "arrow":
+        return ArrowBackend(path)
+    if name != "sqlite":
+        raise ValueError(f"backend inconnu : {name!r}")
+    return SqliteBackend(ConnectionPool(path))
+
+
+class QueryCache:
+    # requêtes nommées et paramétrées, résultats (colonnes dérivées comprises)
+    # mis en cache par (requête, identifiants, paramètres) et invalidés si la
+    # base change
+    def __init__(self, backend, queries=QUERIES, identifiers=IDENTIFIERS):
+        self.backend = backend
+        self.queries = queries
+        self.identifiers = identifiers
+        self._results = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def signature(self):
+        return self.backend.signature()
+
+    def sql(self, name, **identifiers):
+        for key, value in identifiers.items():
+            if value not in self.identifiers.get(key, ()):
+                raise ValueError(f"identifiant non autorisé : {key}={value!r}")
+        return self.queries[name]["sql"].format(**identifiers)
+
+    def run(self, name, params=None, **identifiers):
+        with span("sql", requete=name) as noeud:
+            df = self._run(name, params or {}, identifiers, noeud)
+            noeud["lignes"] = len(df)
+            return df
+
+    def _run(self, name, params, identifiers, noeud):
+        key = (name, tuple(sorted(identifiers.items())), tuple(sorted(params.items())))
+        signature = self.signature()
+        with self._lock:
+            if signature != self._signature:
+                self._results.clear()
+                self._signature = signature
+            if key in self._results:
+                noeud["cache"] = "hit"
+                return self._results[key].copy()
+        noeud["cache"] = "miss"
+        sql = self.sql(name, **identifiers)
+        df = self.backend.query(sql, params, self.queries[name].get("dtype"))
+        if "derive" in self.queries[name]:
+            df = self.queries[name]["derive"](df)
+        with self._lock:
+            self._results[key] = df
+        return df.copy()
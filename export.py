@@ -0,0 +1,152 @@
+import io
+
+import pandas as pd
+
+from store import SUFFIXE_AFFICHAGE, SUFFIXE_SECRET
+
+TAILLE_MORCEAU = 2000
+
+# libellé -> (extension, type MIME)
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "XLSX": (
+        "xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+}
+
+
+def publie(bloc):
+    # colonnes publiées : valeurs couvertes par le secret statistique vidées,
+    # colonnes dérivées (_secret, _affichage) retirées
+    colonnes = {}
+    for col in bloc.columns:
+        if col.endswith((SUFFIXE_SECRET, SUFFIXE_AFFICHAGE)):
+            continue
+        serie = bloc[col]
+        secret = col + SUFFIXE_SECRET
+        if secret in bloc.columns:
+            masque = bloc[secret].to_numpy(dtype=bool)
+            serie = serie.astype("Int64" if serie.dtype.kind in "iu" else "Float64")
+            serie = serie.mask(masque)
+        elif isinstance(serie.dtype, pd.CategoricalDtype) or serie.dtype == object:
+            serie = serie.astype("string")
+        colonnes[col] = serie
+    return pd.DataFrame(colonnes, index=bloc.index)
+
+
+def morceaux(df, taille=TAILLE_MORCEAU):
+    # au moins un morceau, même vide, pour écrire l'en-tête
+    for debut in range(0, max(len(df), 1), taille):
+        yield publie(df.iloc[debut : debut + taille])
+
+
+class Tampon:
+    # fichier en écriture seule dont le contenu est vidé à chaque morceau
+    def __init__(self):
+        self._morceaux = []
+        self.closed = False
+
+    def write(self, octets):
+        self._morceaux.append(bytes(octets))
+        return len(octets)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vide(self):
+        octets = b"".join(self._morceaux)
+        self._morceaux = []
+        return octets
+
+
+def export_csv(df, taille=TAILLE_MORCEAU):
+    # séparateur ";" et BOM : ouverture directe dans un tableur français
+    for i, bloc in enumerate(morceaux(df, taille)):
+        texte = bloc.to_csv(index=False, header=i == 0, sep=";")
+        yield texte.encode("utf-8-sig" if i == 0 else "utf-8")
+
+
+def export_parquet(df, taille=TAILLE_MORCEAU):
+    # un groupe de lignes Parquet par morceau
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tampon = Tampon()
+    writer = schema = None
+    for bloc in morceaux(df, taille):
+        table = pa.Table.from_pandas(bloc, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = table.schema
+            writer = pq.ParquetWriter(tampon, schema)
+        writer.write_table(table)
+        yield tampon.vide()
+    writer.close()
+    yield tampon.vide()
+
+
+def export_xlsx(df, taille=TAILLE_MORCEAU):
+    # lignes écrites au fil de l'eau (constant_memory) ; le classeur, une
+    # archive zip, n'est produit qu'à la fermeture
+    import xlsxwriter
+
+    tampon = io.BytesIO()
+    classeur = xlsxwriter.Workbook(tampon, {"constant_memory": True})
+    feuille = classeur.add_worksheet("indicateurs")
+    ligne = 0
+    for bloc in morceaux(df, taille):
+        if ligne == 0:
+            feuille.write_row(0, 0, list(bloc.columns))
+            ligne = 1
+        for valeurs in (
+            bloc.astype(object).where(bloc.notna(), None).itertuples(index=False)
+        ):
+            feuille.write_row(ligne, 0, valeurs)
+            ligne += 1
+    classeur.close()
+    yield tampon.getvalue()
+
+
+EXPORTS = {"csv": export_csv, "parquet": export_parquet, "xlsx": export_xlsx}
+
+
+class Flux(io.RawIOBase):
+    # générateur de morceaux d'octets lu comme un fichier (st.download_button)
+    def __init__(self, morceaux):
+        self._morceaux = iter(morceaux)
+        self._reste = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset == 0 and whence == io.SEEK_SET and self._position == 0:
+            return 0
+        raise io.UnsupportedOperation("flux d'export : lecture séquentielle")
+
+    def readinto(self, tampon):
+        while not self._reste:
+            try:
+                self._reste = memoryview(next(self._morceaux))
+            except StopIteration:
+                return 0
+        n = min(len(tampon), len(self._reste))
+        tampon[:n] = self._reste[:n]
+        self._reste = self._reste[n:]
+        self._position += n
+        return n
+
+    def readall(self):
+        octets = b"".join([bytes(self._reste), *self._morceaux])
+        self._reste = b""
+        self._position += len(octets)
+        return octets
+
+
+def flux(df, format, taille=TAILLE_MORCEAU):
+    return Flux(EXPORTS[format](df, taille))
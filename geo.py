@@ -0,0 +1,146 @@
+import json
+import math
+import os
+
+import pandas as pd
+
+# tolérance de simplification (en degrés) des contours pré-calculés, par
+# niveau de zoom : de l'ordre d'un demi-pixel à ce zoom
+NIVEAUX_ZOOM = {5: 0.02, 6: 0.01, 8: 0.0025}
+
+
+def simplified_path(path, zoom):
+    base, ext = os.path.splitext(path)
+    return f"{base}_z{zoom}{ext}"
+
+
+def geojson_path(path, zoom):
+    # version simplifiée la plus légère suffisamment précise pour ce zoom,
+    # à défaut le fichier d'origine
+    for niveau in sorted(NIVEAUX_ZOOM):
+        if niveau >= zoom and os.path.exists(simplified_path(path, niveau)):
+            return simplified_path(path, niveau)
+    return path
+
+
+def code_departement(code_insee):
+    return code_insee[:3] if code_insee.startswith("97") else code_insee[:2]
+
+
+def positions(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+    else:
+        for c in coordinates:
+            yield from positions(c)
+
+
+def bbox(geometry):
+    xs, ys = zip(*((p[0], p[1]) for p in positions(geometry["coordinates"])))
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def center(box):
+    xmin, ymin, xmax, ymax = box
+    return xmin + (xmax - xmin) / 2.0, ymin + (ymax - ymin) / 2.0
+
+
+def zoom(box, largeur=500, hauteur=400, minimum=4, maximum=14):
+    # niveau de zoom auquel l'emprise tient dans une carte de cette taille
+    xmin, ymin, xmax, ymax = box
+    dx = max(xmax - xmin, 1e-6)
+    dy = max(ymax - ymin, 1e-6) / math.cos(math.radians((ymin + ymax) / 2))
+    z = math.floor(math.log2(min(largeur / dx, hauteur / dy) * 360 / 256))
+    return max(minimum, min(maximum, z))
+
+
+def joint(collection, df, colonnes, colonne, cle="code", defaut=None):
+    # attache des colonnes de df aux entités d'une FeatureCollection par une
+    # seule jointure sur la clé (propriété `cle` <-> colonne `colonne`) ;
+    # renvoie une nouvelle collection, géométries partagées, sans modifier
+    # celle reçue (qui peut venir d'un cache)
+    features = collection["features"]
+    index = pd.Index(df[colonne])
+    positions = index.get_indexer([f["properties"][cle] for f in features])
+    valeurs = [df[col].to_numpy()[positions].tolist() for col in colonnes]
+    return {
+        **collection,
+        "features": [
+            {
+                **feature,
+                "properties": {
+                    **feature["properties"],
+                    **{
+                        col: valeur if position >= 0 else defaut
+                        for col, valeur in zip(colonnes, ligne)
+                    },
+                },
+            }
+            for feature, position, ligne in zip(features, positions, zip(*valeurs))
+        ],
+    }
+
+
+class GeoReference:
+    # référentiel géographique local (départements, communes, AAV) : noms,
+    # codes, emprises, centres, zooms et contours calculés une seule fois
+    # depuis les fichiers du dépôt. communes.geojson n'est pas versionné
+    # (tools/build_communes_geojson.py, accès réseau requis) : sans lui, les
+    # communes ne sont connues qu'une fois chargées depuis la geo API
+    # (add_communes)
+    def __init__(self, departements, communes, aav=None):
+        self._departements = departements
+        self._communes = communes
+        self._aav = aav or {}
+        self._noms = {code: commune["nom"] for code, commune in communes.items()}
+
+    @classmethod
+    def from_files(cls, departements_path, communes_path=None, aav_path=None):
+        return cls(
+            cls._load(departements_path, "code", "nom"),
+            cls._load(communes_path, "code", "nom"),
+            cls._load(aav_path, "id", "libaav2020"),
+        )
+
+    @classmethod
+    def _load(cls, path, code, nom):
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        return {f["properties"][code]: cls._entry(f, code, nom) for f in features}
+
+    @staticmethod
+    def _entry(feature, code="code", nom="nom"):
+        box = bbox(feature["geometry"])
+        return {
+            "code": feature["properties"][code],
+            "nom": feature["properties"][nom],
+            "bbox": box,
+            "centre": center(box),
+            "zoom": zoom(box),
+            "contour": feature,
+        }
+
+    def add_communes(self, features):
+        # géométries chargées après coup : les noms affichés restent inchangés
+        for feature in features:
+            self._communes[feature["properties"]["code"]] = self._entry(feature)
+
+    def departements(self):
+        return [
+            {"code": d["code"], "nom": d["nom"]}
+            for _, d in sorted(self._departements.items())
+        ]
+
+    def departement(self, code):
+        return self._departements.get(code)
+
+    def commune(self, code_insee):
+        return self._communes.get(code_insee)
+
+    def aav(self, code):
+        return self._aav.get(code)
+
+    def nom_commune(self, code_insee, defaut=None):
+        return self._noms.get(code_insee, defaut)
@@ -0,0 +1,449 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("tdc.store")
+
+SEUIL_SECRET = 11
+
+SUFFIXE_SECRET = "_secret"
+SUFFIXE_AFFICHAGE = "_affichage"
+
+
+def to_number(valeur):
+    if isinstance(valeur, float) and valeur.is_integer():
+        return int(valeur)
+    return valeur
+
+
+def masque_secret(valeurs):
+    # secret statistique : toute valeur < 11 (ou absente) est masquée
+    valeurs = np.asarray(valeurs, dtype=float)
+    secret = np.isnan(valeurs) | (valeurs < SEUIL_SECRET)
+    return [
+        None if masque else to_number(valeur)
+        for valeur, masque in zip(valeurs.tolist(), secret.tolist())
+    ]
+
+
+def format_val(valeur):
+    if valeur is None:
+        return "< 11"
+    return f"{valeur:,}".replace(",", " ")
+
+
+def format_serie(serie):
+    # équivalent vectorisé de format_val sur une colonne entière
+    valeurs = serie.to_numpy(dtype=float)
+    entiers = np.isfinite(valeurs) & (np.round(valeurs) == valeurs)
+    texte = np.where(
+        entiers,
+        np.where(entiers, valeurs, 0).astype("int64").astype(str),
+        valeurs.astype(str),
+    )
+    # séparateur de milliers sur la partie entière seulement
+    parties = pd.Series(texte, index=serie.index, dtype=object).str.partition(".")
+    entier = parties[0].str.replace(r"\B(?=(\d{3})+(?!\d))", " ", regex=True)
+    return entier + parties[1] + parties[2]
+
+
+def base_100(ratio):
+    # ratio bande / AAV ramené sur une échelle 0-200 centrée sur 100
+    ratio = np.asarray(ratio, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            ratio <= 1, np.round(ratio * 100, 1), np.round(100 / (2 - ratio), 1)
+        )
+
+
+# schéma des tables d'indicateurs, par préfixe de colonne : effectifs
+# (entiers), estimations (€, m2, %) et codes répétés (catégories)
+SCHEMA = {
+    "index": "effectif",
+    "nb_": "effectif",
+    "surfaces_": "effectif",
+    "stoth_": "effectif",
+    "estim": "estimation",
+    "mape": "estimation",
+    "iddep": "code",
+    "comm_": "code",
+}
+
+ENTIERS = [np.int8, np.int16, np.int32, np.int64]
+
+
+def type_schema(col, schema=SCHEMA):
+    for prefixe, type in schema.items():
+        if col.startswith(prefixe):
+            return type
+    return None
+
+
+def plus_petit_entier(valeurs):
+    vmin, vmax = (valeurs.min(), valeurs.max()) if len(valeurs) else (0, 0)
+    for entier in ENTIERS:
+        if np.iinfo(entier).min <= vmin and vmax <= np.iinfo(entier).max:
+            return entier
+    return np.float64
+
+
+def compacte_nombres(serie, type):
+    valeurs = serie.to_numpy(dtype=float)
+    # float32 seulement si toutes les valeurs y sont exactes
+    if type == "estimation" and np.array_equal(
+        valeurs.astype(np.float32), valeurs, equal_nan=True
+    ):
+        return serie.astype(np.float32)
+    if np.isfinite(valeurs).all() and (np.round(valeurs) == valeurs).all():
+        return serie.astype(plus_petit_entier(valeurs))
+    return serie
+
+
+def compacte(df, schema=SCHEMA):
+    # types appliqués au chargement : effectifs en entiers, estimations en
+    # float32 quand la précision le permet, codes répétés en catégories
+    colonnes = {}
+    for col in df.columns:
+        type = type_schema(col, schema)
+        serie = df[col]
+        if type == "code" and serie.nunique() <= len(serie) // 2:
+            serie = serie.astype("category")
+        elif type in ("effectif", "estimation") and serie.dtype.kind in "fiu":
+            serie = compacte_nombres(serie, type)
+        colonnes[col] = serie
+    return pd.DataFrame(colonnes, index=df.index)
+
+
+def memoire(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def colonnes_indicateurs(df):
+    return [
+        col
+        for col in df.select_dtypes("number").columns
+        if col != "index" and not col.endswith(SUFFIXE_SECRET)
+    ]
+
+
+def derive(df):
+    # colonnes calculées une fois au chargement : masque du secret statistique
+    # et valeur formatée pour l'affichage, pour chaque indicateur
+    colonnes = colonnes_indicateurs(df)
+    valeurs = df[colonnes].to_numpy(dtype=float)
+    secret = np.isnan(valeurs) | (valeurs < SEUIL_SECRET)
+    derivees = {}
+    for j, col in enumerate(colonnes):
+        derivees[col + SUFFIXE_SECRET] = secret[:, j]
+        derivees[col + SUFFIXE_AFFICHAGE] = np.where(
+            secret[:, j], format_val(None), format_serie(df[col])
+        )
+    return pd.concat([df, pd.DataFrame(derivees, index=df.index)], axis=1)
+
+
+# indicateurs qui ne s'additionnent pas entre territoires (taux d'erreur)
+NON_ADDITIFS = ["mape"]
+
+
+class IndicatorStore:
+    # indicateurs d'un périmètre indexés par idcom / iddep : une recherche
+    # de territoire est une lecture de dictionnaire, sans parcours du DataFrame.
+    # Un tuple de codes désigne un regroupement de territoires, agrégé à la
+    # volée
+    def __init__(self, df, id="idcom"):
+        df = df[df[id].notna()]
+        colonnes = colonnes_indicateurs(df)
+        self.id = id
+        self.columns = list(df.columns)
+        self._positions = {code: i for i, code in enumerate(df[id])}
+        self._colonnes = {col: j for j, col in enumerate(colonnes)}
+        self._matrice = df[colonnes].to_numpy(dtype=float)
+        self._secret = df[[c + SUFFIXE_SECRET for c in colonnes]].to_numpy(bool)
+        self._textes = df[[c + SUFFIXE_AFFICHAGE for c in colonnes]].to_numpy(object)
+        self._additifs = np.array([col not in NON_ADDITIFS for col in colonnes])
+
+    def __contains__(self, code):
+        return code in self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def codes(self):
+        return list(self._positions)
+
+    def agrege(self, columns, codes):
+        # sommes du regroupement en une opération sur la matrice ; absente si
+        # aucun territoire n'est renseigné ou si l'indicateur n'est pas additif.
+        # Le total est secret dès qu'un territoire l'est : sinon le retrancher
+        # d'un regroupement voisin redonnerait la valeur masquée
+        positions = [self._positions[code] for code in codes]
+        cols = [self._colonnes[col] for col in columns]
+        lignes = self._matrice[np.ix_(positions, cols)]
+        renseignes = ~np.isnan(lignes).all(axis=0) & self._additifs[cols]
+        sommes = np.where(renseignes, np.nansum(lignes, axis=0), np.nan)
+        secret = self._secret[np.ix_(positions, cols)].any(axis=0)
+        return sommes, secret
+
+    def values(self, columns, code):
+        # valeurs brutes, None pour celles couvertes par le secret statistique
+        if isinstance(code, tuple):
+            sommes, secret = self.agrege(columns, code)
+            return [
+                None if masque else valeur
+                for valeur, masque in zip(masque_secret(sommes), secret.tolist())
+            ]
+        i = self._positions[code]
+        cols = [self._colonnes[col] for col in columns]
+        return [
+            None if secret else to_number(valeur)
+            for valeur, secret in zip(
+                self._matrice[i, cols].tolist(), self._secret[i, cols].tolist()
+            )
+        ]
+
+    def textes(self, columns, code):
+        if isinstance(code, tuple):
+            return [format_val(valeur) for valeur in self.values(columns, code)]
+        i = self._positions[code]
+        return self._textes[i, [self._colonnes[col] for col in columns]].tolist()
+
+
+ZONE_NATIONALE = "Littoral"
+
+
+def additives(df):
+    return [col for col in colonnes_indicateurs(df) if col not in NON_ADDITIFS]
+
+
+def cumul_departements(communes):
+    # un département cumule ses communes littorales (loi littorale), comme
+    # les tables indicateurs_dpt_*
+    littorales = communes[communes["comm_litt"] == "oui"]
+    groupes = littorales.groupby("iddep", sort=True, observed=True)
+    df = groupes[additives(communes)].sum(min_count=1)
+    decret = (littorales["comm_decret"] == "oui").groupby(littorales["iddep"])
+    df.insert(0, "comm_decret", decret.sum().astype(str))
+    df.insert(1, "comm_litt", groupes.size().astype(str))
+    df = df.reset_index()
+    df.insert(0, "index", range(len(df)))
+    return df
+
+
+def cumul_national(departements):
+    colonnes = additives(departements)
+    df = departements[colonnes].sum(min_count=1).to_frame().T
+    df.insert(0, "zone", ZONE_NATIONALE)
+    df.insert(0, "index", 0)
+    return df
+
+
+def verifie(cumul, table, id, nom):
+    # niveau agrégé comparé à la table publiée : mêmes territoires, mêmes
+    # totaux sur les colonnes communes. Renvoie l'écart constaté, None sinon
+    if set(cumul[id]) != set(table[id]):
+        return f"{nom} : territoires différents du cumul des communes"
+    colonnes = [col for col in additives(cumul) if col in table.columns]
+    attendu = table.set_index(id)[colonnes].to_numpy(dtype=float)
+    obtenu = cumul.set_index(id).loc[table[id], colonnes].to_numpy(dtype=float)
+    ecarts = ~np.isclose(obtenu, attendu, rtol=1e-9, equal_nan=True).all(axis=0)
+    if ecarts.any():
+        colonnes = [col for col, ecart in zip(colonnes, ecarts) if ecart]
+        return f"{nom} incohérente avec le cumul des communes : {colonnes}"
+    return None
+
+
+def empile(frames, perimetres):
+    # format long : une ligne par (niveau, code, périmètre), index trié pour
+    # que les bandes d'un même territoire forment une plage contiguë
+    morceaux = []
+    for (perimetre, id), df in frames.items():
+        index = pd.MultiIndex.from_arrays(
+            [
+                [id] * len(df),
+                df[id],
+                pd.Categorical([perimetre] * len(df), categories=perimetres),
+            ],
+            names=["niveau", "code", "perimetre"],
+        )
+        morceaux.append(df[colonnes_indicateurs(df)].set_axis(index))
+    return pd.concat(morceaux).sort_index()
+
+
+class RollupCube:
+    # cube commune -> département -> national, par périmètre, matérialisé une
+    # fois depuis les tables communales : toutes les vues lisent les mêmes
+    # frames et IndicatorStore. Les niveaux agrégés sont vérifiés contre les
+    # tables indicateurs_dpt_* et indicateurs_national quand elles sont données :
+    # un écart est journalisé et gardé dans ecarts, le cumul des communes fait foi.
+    # Les trois niveaux de tous les périmètres sont aussi empilés dans une
+    # table longue (valeurs brutes) indexée par (niveau, code, périmètre)
+    def __init__(self, communes, departements=None, national=None, prepare=None):
+        prepare = prepare or (lambda df: df)
+        self.perimetres = list(communes)
+        self.ecarts = []
+        frames = {}
+        for perimetre, df in communes.items():
+            dep = cumul_departements(df)
+            nat = cumul_national(dep)
+            ecarts = []
+            if departements is not None:
+                ecarts.append(
+                    verifie(
+                        dep,
+                        departements[perimetre],
+                        "iddep",
+                        f"indicateurs_dpt_{perimetre}",
+                    )
+                )
+            if national is not None:
+                ecarts.append(
+                    verifie(
+                        nat,
+                        national[perimetre],
+                        "zone",
+                        f"indicateurs_national {perimetre}",
+                    )
+                )
+            for ecart in filter(None, ecarts):
+                logger.warning(ecart)
+                self.ecarts.append(ecart)
+            for id, frame in [("idcom", df), ("iddep", dep), ("zone", nat)]:
+                frames[perimetre, id] = frame
+        self.long = fige(compacte(empile(frames, self.perimetres)))
+        self._frames = {cle: prepare(frame) for cle, frame in frames.items()}
+        self._stores = {
+            (perimetre, id): IndicatorStore(frame, id)
+            for (perimetre, id), frame in self._frames.items()
+        }
+
+    def frame(self, perimetre, id="idcom"):
+        return self._frames[perimetre, id]
+
+    def store(self, perimetre, id="idcom"):
+        return self._stores[perimetre, id]
+
+    def tranche(self, id=None, code=None, perimetre=None, colonnes=None):
+        # projection d'une plage de l'index composite, None pour tout prendre
+        cle = (
+            slice(None) if id is None else id,
+            slice(None) if code is None else code,
+            slice(None) if perimetre is None else [perimetre],
+        )
+        return self.long.loc[cle, colonnes if colonnes is not None else slice(None)]
+
+
+class TerritoryHierarchy:
+    # départements -> communes d'un périmètre, construit une fois : codes dans
+    # l'ordre d'affichage, filtre littoral et noms pour les listes de choix
+    def __init__(self, df, departements, nom_commune=None):
+        df = df[df["idcom"].notna()].sort_values("idcom")
+        presents = set(df["iddep"])
+        self._departements = {
+            code: nom for code, nom in departements.items() if code in presents
+        }
+        self._noms = {}
+        self._communes = {code: ([], []) for code in self._departements}
+        for code, nom, dep, litt in zip(
+            df["idcom"], df["libcom"], df["iddep"], df["comm_litt"]
+        ):
+            self._noms[code] = nom_commune(code, nom) if nom_commune else nom
+            toutes, littorales = self._communes.setdefault(dep, ([], []))
+            toutes.append(code)
+            if litt == "oui":
+                littorales.append(code)
+        self._littoraux = [
+            code for code in self._departements if self._communes[code][1]
+        ]
+
+    def departements(self, littoral_only=False):
+        # littoral_only : départements ayant au moins une commune littorale
+        return list(self._littoraux if littoral_only else self._departements)
+
+    def nom_departement(self, code):
+        return self._departements[code]
+
+    def communes(self, departement=None, littoral_only=True):
+        # departement None : toutes les communes du périmètre
+        if departement is None:
+            return [
+                code
+                for dep in self._departements
+                for code in self.communes(dep, littoral_only)
+            ]
+        toutes, littorales = self._communes.get(departement, ([], []))
+        return littorales if littoral_only else toutes
+
+    def nom_commune(self, code):
+        return self._noms[code]
+
+
+def lecture_seule(*args, **kwargs):
+    raise TypeError("données partagées en lecture seule : copier avant de modifier")
+
+
+class ReadOnlyFrame(pd.DataFrame):
+    # DataFrame partagé entre toutes les sessions (st.cache_resource), sans
+    # copie : ajout, suppression ou renommage de colonne et opérations
+    # inplace lèvent TypeError, écrire une valeur lève ValueError (tableaux
+    # numpy non modifiables) ; les frames dérivés sont des DataFrame ordinaires
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    __setitem__ = __delitem__ = insert = pop = update = lecture_seule
+    _update_inplace = lecture_seule
+
+    def __setattr__(self, name, value):
+        if name in ("columns", "index"):
+            lecture_seule()
+        super().__setattr__(name, value)
+
+
+def fige(df):
+    colonnes = {}
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codes = serie.cat.codes.to_numpy(copy=True)
+            codes.flags.writeable = False
+            valeurs = pd.Categorical.from_codes(codes, dtype=serie.dtype)
+        elif isinstance(serie.dtype, np.dtype):
+            valeurs = serie.to_numpy()
+            valeurs.flags.writeable = False
+        else:
+            valeurs = serie.to_numpy(dtype=object, copy=True)
+            valeurs.flags.writeable = False
+        colonnes[col] = pd.Series(
+            valeurs, index=df.index, dtype=valeurs.dtype, copy=False
+        )
+    return ReadOnlyFrame(colonnes, copy=False)
+
+
+class ReadOnlyDict(dict):
+    __setitem__ = __delitem__ = __ior__ = lecture_seule
+    clear = pop = popitem = setdefault = update = lecture_seule
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class ReadOnlyList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = lecture_seule
+    append = clear = extend = insert = pop = remove = reverse = sort = lecture_seule
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+
+def fige_json(objet):
+    # GeoJSON partagé : dictionnaires et listes non modifiables, toujours
+    # sérialisables (json, plotly, folium). Une partie déjà figée (géométries
+    # d'un contour en cache) est reprise telle quelle, sans copie
+    if isinstance(objet, (ReadOnlyDict, ReadOnlyList)):
+        return objet
+    if isinstance(objet, dict):
+        return ReadOnlyDict((k, fige_json(v)) for k, v in objet.items())
+    if isinstance(objet, list):
+        return ReadOnlyList(fige_json(v) for v in objet)
+    return objet
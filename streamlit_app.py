@@ -1,12 +1,32 @@
-import sqlite3
-import json
-import requests
 import folium
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 import streamlit as st
 from streamlit_folium import st_folium
+from commun import (
+    INDICATEURS_CHIFFRES,
+    PERIMETRES,
+    ask,
+    comparaison_bandes,
+    enregistre_trace,
+    extrait_communes,
+    fiche_departement,
+    geo_client,
+    geo_reference,
+    gets,
+    graphe_age_parc,
+    graphe_estimation_logement_taille,
+    graphe_foncier,
+    graphe_occupation_parc,
+    hierarchie,
+    indicateurs,
+    onglet_aav,
+    onglet_national,
+    plotly_chart,
+    profilage,
+    telechargement,
+)
+from geo import bbox, center, code_departement, zoom
+import tracing
+from tracing import span, traced
 import locale
 
 # locale.setlocale(locale.LC_ALL, 'fr_FR')
@@ -18,364 +38,6 @@ import locale
 ####
 
 
-def ask(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-    except Exception as e:
-        return None
-
-
-conn = sqlite3.connect("indicateurs_tdc.sqlite3")
-
-
-def format_dep(departement):
-    return departement.lstrip("0").zfill(2)
-
-
-@st.cache_data
-def data(perimetre):
-    df = pd.read_sql_query(
-        f"SELECT * FROM indicateurs_com_{perimetre}",
-        con=conn,
-        dtype={"idcom": str, "iddep": str},
-    )
-    df["iddep"] = df["iddep"].apply(format_dep)
-    return df
-
-
-@st.cache_data
-def data_dep(perimetre):
-    df = pd.read_sql_query(
-        f"SELECT * FROM indicateurs_dpt_{perimetre}", con=conn, dtype={"iddep": str}
-    )
-    df["iddep"] = df["iddep"].apply(format_dep)
-    return df
-
-
-def get_val(value, code, perimetre, id="idcom"):
-    df = data(perimetre) if id == "idcom" else data_dep(perimetre)
-    valeur = df[df[id] == code][value].values[0]
-    if valeur < 11:
-        return None
-    return int(valeur) if valeur.is_integer() else valeur
-
-
-def get(value, code, perimetre, id="idcom"):
-    valeur = get_val(value, code, perimetre, id=id)
-    if valeur is None:
-        return "< 11"
-    return f"{valeur:,}".replace(",", " ")
-
-
-def get_departements_dispo(perimetre):
-    df = data(perimetre)
-    deps = [d for d in list(df["iddep"].unique())]
-    return deps
-
-
-@st.cache_data
-def get_departements(perimetre):
-    url = f"https://geo.api.gouv.fr/departements/"
-    departements = ask(url)
-    return [d for d in departements if d["code"] in get_departements_dispo(perimetre)]
-
-
-def get_communes_dispo(departement, perimetre, littoral_only=True):
-    df = data(perimetre)
-    if littoral_only:
-        df = df[df["comm_litt"] == "oui"]
-    comm = list(df[df["iddep"] == departement]["idcom"].unique())
-    return comm
-
-
-@st.cache_data
-def get_communes(departement, perimetre, littoral_only=True):
-    url = f"https://geo.api.gouv.fr/departements/{departement}/communes"
-    communes = ask(url)
-    return [
-        c
-        for c in communes
-        if c["code"] in get_communes_dispo(departement, perimetre, littoral_only)
-    ]
-
-
-@st.cache_data
-def data_aav():
-    with open("aav.geojson") as response:
-        aav = json.load(response)
-    for a in aav["features"]:
-        a["id"] = a["properties"]["id"]
-    return aav
-
-
-@st.cache_data
-def carto_aav(ratio, perimetre):
-    seuil = perimetre[:-1]
-    aav = data_aav()
-    df = pd.read_sql_query(
-        f"""
-                           SELECT aav2020, libaav2020, {ratio} AS ratio 
-                           FROM indicateurs_aav 
-                           WHERE seuil_frange={seuil}
-                           """,
-        con=conn,
-        dtype={"aav2020": str},
-    )
-    df["comparaison_base_100"] = df["ratio"].apply(
-        lambda x: round(x * 100, 1) if x <= 1 else round(100 / (2 - x), 1)
-    )
-
-    fig = px.choropleth_mapbox(
-        df,
-        geojson=aav,
-        locations="aav2020",
-        color="comparaison_base_100",
-        color_continuous_scale="tropic",
-        range_color=(50, 150),
-        mapbox_style="carto-positron",
-        zoom=5,
-        center={"lat": 50, "lon": 3},
-        opacity=0.7,
-        # mapbox_style="open-street-map",
-        hover_name="libaav2020",
-        labels={"comparaison_base_100": "Pourcentage", "aav2020": "Code AAV"},
-    )
-    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
-    return fig
-
-
-def graphe_aav(type, perimetre):
-    seuil = perimetre[:-1]
-    df = pd.read_sql_query(
-        f"""
-                        SELECT aav2020, libaav2020, '2015' AS annee,  
-                        valeur_ratio_2015_{type} AS ratio
-                        FROM indicateurs_aav 
-                        WHERE seuil_frange={seuil}
-                        
-                        UNION
-                        
-                        SELECT aav2020, libaav2020, '2018' AS annee,  
-                        valeur_ratio_2018_{type} AS ratio
-                        FROM indicateurs_aav 
-                        WHERE seuil_frange={seuil}
-
-                        UNION
-                        
-                        SELECT aav2020, libaav2020, '2021' AS annee,  
-                        valeur_ratio_2021_{type} AS ratio
-                        FROM indicateurs_aav 
-                        WHERE seuil_frange={seuil}
-
-                    ORDER BY aav2020 DESC 
-                        """,
-        con=conn,
-        dtype={"aav2020": str},
-    )
-
-    df["base_100"] = df["ratio"].apply(
-        lambda x: round(x * 100, 1) if x <= 1 else round(100 / (2 - x), 1)
-    )
-    fig = px.scatter(df, y="libaav2020", x="base_100", color="annee")
-    fig.add_vrect(
-        x0="100",
-        x1="200",
-        annotation_text="Valeurs foncières supérieures au sein la bande",
-        annotation_position="top left",
-        fillcolor="tomato",
-        opacity=0.25,
-        line_width=0,
-    )
-    fig.update_layout(height=4000)
-    fig.update_layout(
-        title_text="Situation des prix des dans la bande par rapport à l'AAV"
-    )
-    return fig
-
-
-def taux_rotation(perimetre):
-    seuil = perimetre[:-1]
-    df = pd.read_sql_query(
-        f"""
-                           SELECT libaav2020 AS "Nom AAV", 
-                                cast(tx_rotation_impact * 100.0 As text) || ' %' AS "Taux rotation dans la zone", 
-                                cast(tx_rotation_non_impact * 100.0 As text) || ' %' AS "Taux rotation hors zone"
-                           FROM indicateurs_aav 
-                           WHERE seuil_frange={seuil};
-                           """,
-        con=conn,
-    )
-    return df
-
-
-def graphe_occupation_parc(code_insee, perimetre, id="idcom"):
-    type_occupation = [
-        "Total",
-        "Occupés par propriétaire",
-        "Loué",
-        "Résidences secondaires",
-        "Vacants",
-    ]
-    valeurs = [
-        get("nb_logt", code_insee, perimetre, id=id),
-        get("nb_logt_po", code_insee, perimetre, id=id),
-        get("nb_logt_pb", code_insee, perimetre, id=id),
-        get("nb_logt_rs", code_insee, perimetre, id=id),
-        get("nb_logt_va", code_insee, perimetre, id=id),
-    ]
-    fig = go.Figure([go.Bar(x=type_occupation, y=valeurs)])
-    fig.update_layout(
-        title_text="Nombre de logements concernés en fonction de leur occupation"
-    )
-    return fig
-
-
-def graphe_age_parc(code_insee, perimetre, id="idcom"):
-    type_occupation = [
-        "Total",
-        "Avant 1945",
-        "1945-1959",
-        "1960-1974",
-        "1975-1997",
-        "1998-2012",
-        "Après 2012",
-    ]
-    valeurs_maison = [
-        get("nb_maisons", code_insee, perimetre, id=id),
-        get("nb_maisons_av45", code_insee, perimetre, id=id),
-        get("nb_maisons_45_59", code_insee, perimetre, id=id),
-        get("nb_maisons_60_74", code_insee, perimetre, id=id),
-        get("nb_maisons_75_97", code_insee, perimetre, id=id),
-        get("nb_maisons_98_12", code_insee, perimetre, id=id),
-        get("nb_maisons_ap12", code_insee, perimetre, id=id),
-    ]
-    valeurs_appartement = [
-        get("nb_appts", code_insee, perimetre, id=id),
-        get("nb_appts_av45", code_insee, perimetre, id=id),
-        get("nb_appts_45_59", code_insee, perimetre, id=id),
-        get("nb_appts_60_74", code_insee, perimetre, id=id),
-        get("nb_appts_75_97", code_insee, perimetre, id=id),
-        get("nb_appts_98_12", code_insee, perimetre, id=id),
-        get("nb_appts_ap12", code_insee, perimetre, id=id),
-    ]
-    fig = go.Figure(
-        [
-            go.Bar(x=type_occupation, y=valeurs_maison, name="Maison"),
-            go.Bar(x=type_occupation, y=valeurs_appartement, name="Appartements"),
-        ]
-    )
-    fig.update_layout(
-        title_text="Nombre de logements concernés en fonction de leur période de construction"
-    )
-    return fig
-
-
-def graphe_foncier(code_insee, perimetre, id="idcom"):
-    labels = ["Surfaces NAF", "Surface urbanisées"]
-    values = [
-        get_val("surfaces_naf", code_insee, perimetre, id=id),
-        get_val("surfaces_urba", code_insee, perimetre, id=id),
-    ]
-    fig = go.Figure(data=[go.Pie(labels=labels, values=values)])
-    return fig
-
-
-def graphe_estimation_logement_taille(code_insee, perimetre, id="idcom"):
-    data = dict(
-        typo=[
-            "Maison",
-            "Maison",
-            "Maison",
-            "Appartement",
-            "Appartement",
-            "Appartement",
-        ],
-        taille=[
-            "Petite",
-            "Moyenne",
-            "Grande",
-            "Petit",
-            "Moyen",
-            "Grand",
-        ],
-        estimation=[
-            get_val("estim_maisons_petites", code_insee, perimetre, id=id),
-            get_val("estim_maisons_moyennes", code_insee, perimetre, id=id),
-            get_val("estim_maisons_grandes", code_insee, perimetre, id=id),
-            get_val("estim_appts_petits", code_insee, perimetre, id=id),
-            get_val("estim_appts_moyens", code_insee, perimetre, id=id),
-            get_val("estim_appts_grands", code_insee, perimetre, id=id),
-        ],
-    )
-    df = pd.DataFrame.from_dict(data)
-    fig = px.sunburst(
-        df,
-        path=["typo", "taille"],
-        values="estimation",
-        # title="Estimation financière des logements selon leur taille",
-    )
-    fig.update_traces(textinfo="label+percent entry")
-    return fig
-
-
-def graphe_estimation_logement_age(code_insee, perimetre, id="idcom"):
-    data = dict(
-        typo=[
-            "Maison",
-            "Maison",
-            "Maison",
-            "Maison",
-            "Maison",
-            "Maison",
-            "Appartement",
-            "Appartement",
-            "Appartement",
-            "Appartement",
-            "Appartement",
-            "Appartement",
-        ],
-        taille=[
-            "Avant 1945",
-            "1945-1959",
-            "1960-1974",
-            "1975-1997",
-            "1998-2012",
-            "Après 2012",
-            "Avant 1945",
-            "1945-1959",
-            "1960-1974",
-            "1975-1997",
-            "1998-2012",
-            "Après 2012",
-        ],
-        estimation=[
-            get_val("estim_maisons_av45", code_insee, perimetre, id=id),
-            get_val("estim_maisons_45_59", code_insee, perimetre, id=id),
-            get_val("estim_maisons_60_74", code_insee, perimetre, id=id),
-            get_val("estim_maisons_75_97", code_insee, perimetre, id=id),
-            get_val("estim_maisons_98_12", code_insee, perimetre, id=id),
-            get_val("estim_maisons_ap12", code_insee, perimetre, id=id),
-            get_val("estim_appts_av45", code_insee, perimetre, id=id),
-            get_val("estim_appts_45_59", code_insee, perimetre, id=id),
-            get_val("estim_appts_60_74", code_insee, perimetre, id=id),
-            get_val("estim_appts_75_97", code_insee, perimetre, id=id),
-            get_val("estim_appts_98_12", code_insee, perimetre, id=id),
-            get_val("estim_appts_ap12", code_insee, perimetre, id=id),
-        ],
-    )
-    df = pd.DataFrame.from_dict(data)
-    fig = px.sunburst(
-        df,
-        path=["typo", "taille"],
-        values="estimation",
-        # title="Estimation financière des logements selon leur taille",
-    )
-    fig.update_traces(textinfo="label+percent entry")
-    return fig
-
-
 def style_perimetre(feature):
     return {
         "fillOpacity": 0.1,
@@ -394,26 +56,73 @@ def style_recul(feature):
     }
 
 
-@st.cache_data
 def get_center(code_insee):
-    url = f"https://geo.api.gouv.fr/communes/{code_insee}/?format=geojson&geometry=bbox"
-    geojson = ask(url)
-    coordinates = geojson["geometry"]["coordinates"][0]
-    xmin = min([x for x, y in coordinates])
-    xmax = max([x for x, y in coordinates])
-    ymin = min([y for x, y in coordinates])
-    ymax = max([y for x, y in coordinates])
-    x_center = xmin + (xmax - xmin) / 2.0
-    y_center = ymin + (ymax - ymin) / 2.0
-    return x_center, y_center
-
-
-@st.cache_data
+    territoire = geo_reference().commune(code_insee)
+    if territoire is None:
+        geojson = get_perimetre(code_insee)
+        if geojson is not None:
+            box = bbox(geojson["geometry"])
+            return center(box), zoom(box)
+        territoire = geo_reference().departement(code_departement(code_insee))
+    if territoire is None:
+        return (3, 47), 6
+    return territoire["centre"], territoire["zoom"]
+
+
+# pas de st.cache_data : un échec (panne, disjoncteur ouvert) renvoie None,
+# qui serait gardé ; GeoClient garde déjà les réponses obtenues
+@traced()
 def get_perimetre(code_insee):
-    url = f"https://geo.api.gouv.fr/communes/{code_insee}/?format=geojson&geometry=contour"
+    commune = geo_reference().commune(code_insee)
+    if commune is not None:
+        return commune["contour"]
+    url = f"/communes/{code_insee}/?format=geojson&geometry=contour"
     return ask(url)
 
 
+def get_center_groupe(codes):
+    # emprise de l'ensemble des communes connues du référentiel
+    boxes = [c["bbox"] for c in map(geo_reference().commune, codes) if c is not None]
+    if not boxes:
+        return (3, 47), 6
+    xmin, ymin, xmax, ymax = zip(*boxes)
+    box = min(xmin), min(ymin), max(xmax), max(ymax)
+    return center(box), zoom(box)
+
+
+def get_perimetre_groupe(codes):
+    # contours déjà en mémoire uniquement : pas d'appel à l'API par commune
+    contours = [
+        c["contour"] for c in map(geo_reference().commune, codes) if c is not None
+    ]
+    if not contours:
+        return None
+    return {"type": "FeatureCollection", "features": contours}
+
+
+def prefetch_communes(departement, perimetre):
+    # contours de toutes les communes du département en une requête, en tâche
+    # de fond : le changement de commune est ensuite servi depuis la mémoire
+    reference = geo_reference()
+    codes = set(hierarchie(perimetre).communes(departement, littoral_only=False))
+    if all(reference.commune(code) is not None for code in codes):
+        return
+
+    def ajoute(future):
+        communes = future.result()
+        if communes is not None:
+            reference.add_communes(
+                c for c in communes["features"] if c["properties"]["code"] in codes
+            )
+
+    url = (
+        f"/departements/{departement}/communes"
+        "?fields=nom,code,contour&format=geojson&geometry=contour"
+    )
+    for future in geo_client().prefetch([url]):
+        future.add_done_callback(ajoute)
+
+
 ######
 
 ## APP
@@ -429,6 +138,9 @@ st.set_page_config(
 st.title("Evaluation économique sur le littoral")
 
 
+tracing.puits = enregistre_trace
+
+
 def password_entered():
     if st.session_state["password"] == st.secrets["password"]:
         st.session_state["password_correct"] = True
@@ -453,390 +165,320 @@ def check_password():
         return True
 
 
-if check_password():
-    perimetres = ["200m", "1000m", "10000m"]
-    perimetre = st.selectbox(
-        "Choix de la distance au littoral (limite terre-mer)", perimetres
+@st.fragment
+@traced(racine=True)
+def onglet_departement(perimetre):
+    with st.expander("Précisions"):
+        st.write(
+            """
+        Les données calculées à l'échelle départementale concernent 
+        uniquement les communes en bord de mer au sens de la loi littorale.
+                     """
+        )
+    territoires = hierarchie(perimetre)
+    # seuls les départements publiés : ceux sans commune littorale n'ont pas
+    # de ligne dans indicateurs_dpt_*
+    publies = indicateurs(perimetre, "iddep")
+    code_dep = st.selectbox(
+        "Choix d'un département",
+        [code for code in territoires.departements() if code in publies],
+        format_func=territoires.nom_departement,
+        key="departement_dep",
+        persist_state="page",
     )
 
-    tab_comm, tab_dep, tab_aav = st.tabs(["Commune", "Département", "AAV"])
-
-    with tab_aav:
-        st.header(f"Aires d'attraction des villes")
-
-        with st.expander("Précisions"):
-            st.write(
-                """
-        Les indicateurs de comparaison de marchés à l'AAV 
-        concernent uniquement les bandes des communes 
-        en bord de mer au sens de la loi littorale.
-                     """
+    fiche_departement(code_dep, territoires.nom_departement(code_dep), perimetre)
+
+
+# fragment : un changement de département, de commune ou du filtre littoral
+# ne relance que cet onglet, la fiche ne dépend que de la commune retenue
+@st.fragment
+@traced(racine=True)
+def onglet_commune(perimetre):
+    col_dep, col_com = st.columns(2)
+
+    # filtre littoral lu d'abord : la liste des départements en dépend
+    with col_com:
+        col_comm, col_check = st.columns([0.6, 0.4])
+        with col_check:
+            littoral = st.checkbox(
+                "Riveraines mers et océans",
+                value=True,
+                key="littoral",
+                persist_state="page",
             )
 
-        st.subheader("Comparaison des niveaux de prix en 2021")
-
-        st.markdown(
-            """
-        Pour les maisons moyennes et les appartements 3/4 pièces,
-        une comparaison du prix médian dans la bande littorale par rapport 
-        au prix médian dans chaque territoire de référence (Aire d'Attration des Villes)
-        est proposée."""
+    with col_dep:
+        territoires = hierarchie(perimetre)
+        coddep = st.selectbox(
+            "Choix du département",
+            territoires.departements(littoral),
+            format_func=territoires.nom_departement,
+            key="departement",
+            persist_state="page",
         )
-
-        with st.spinner("Chargement..."):
-            col_carto_aav_mai, col_carto_aav_apt = st.columns(2)
-            with col_carto_aav_mai:
-                st.subheader("Maisons moyennes (90-130 m2)")
-                st.plotly_chart(
-                    carto_aav("valeur_ratio_2021_maison", perimetre),
-                    use_container_width=True,
-                )
-            with col_carto_aav_apt:
-                st.subheader("Appartements 3/4 pièces")
-                st.plotly_chart(
-                    carto_aav("valeur_ratio_2021_appt", perimetre),
-                    use_container_width=True,
-                )
-
-        st.markdown(
-            """
-        *Interprétation : si le ratio calculé à 200 m vaut 122 % 
-        pour les maisons moyennes de l'AAV de Vannes, cela signifie, que les
-        biens situés dans la zone littorale des 200 m sur cette AAV sont 1,22 fois 
-        plus chers que ceux du même AAV à l'extérieur de cette zone.*
-        """
+        multiple = st.toggle(
+            "Regrouper plusieurs communes", key="multiple", persist_state="page"
         )
 
-        st.subheader("Evolution des niveaux de prix par AAV de 2015 à 2021")
+    prefetch_communes(coddep, perimetre)
+
+    with col_comm:
+        if multiple:
+            codes = choix_communes(territoires, coddep, littoral)
+        else:
+            code_insee = st.selectbox(
+                "Choix de la commune",
+                territoires.communes(coddep, littoral),
+                format_func=territoires.nom_commune,
+                key="commune",
+                persist_state="page",
+            )
 
-        with st.spinner("Chargement..."):
-            col_graphe_aav_mai, col_graphe_aav_apt = st.columns(2)
-            with col_graphe_aav_mai:
-                st.subheader("Maisons moyennes (90-130 m2)")
-                st.plotly_chart(
-                    graphe_aav("maison", perimetre), use_container_width=True
-                )
-            with col_graphe_aav_apt:
-                st.subheader("Appartements 3/4 pièces")
-                st.plotly_chart(graphe_aav("appt", perimetre), use_container_width=True)
+    if not multiple:
+        if code_insee is None:
+            st.info("Aucune commune pour ce département et ce filtre.")
+            return
+        fiche_commune(code_insee, territoires.nom_commune(code_insee), perimetre)
+    elif codes:
+        for departement in sorted({code_departement(code) for code in codes}):
+            prefetch_communes(departement, perimetre)
+        fiche_commune(tuple(codes), f"{len(codes)} communes", perimetre)
+    else:
+        st.info("Sélectionner au moins une commune.")
 
-        st.subheader("Taux de rotation du parc privé")
-        st.markdown(
-            """
-        Les taux de rotation proposés correspondent au nombre de logements privés ayant muté entre 2019 et 2021 
-        divisé par la taille du parc de logements privés en 2019 dans les zones concernées et non concernées.  
-        """
-        )
 
-        st.dataframe(taux_rotation(perimetre), use_container_width=True)
+def ajoute_communes(codes):
+    st.session_state["communes"] = list(
+        dict.fromkeys(st.session_state.get("communes", []) + codes)
+    )
 
-    with tab_dep:
-        with st.expander("Précisions"):
-            st.write(
-                """
-        Les données calculées à l'échelle départementale concernent 
-        uniquement les communes en bord de mer au sens de la loi littorale.
-                     """
-            )
-        departements_dep = get_departements(perimetre)
-        departement_dep = st.selectbox(
-            "Choix d'un département", [d["nom"] for d in departements_dep]
-        )
 
-        code_dep = [d["code"] for d in departements_dep if d["nom"] == departement_dep][
-            0
+def choix_communes(territoires, coddep, littoral):
+    # regroupement libre (intercommunalité, portion de côte) : communes de tout
+    # le périmètre, le département choisi peut être ajouté d'un coup
+    options = territoires.communes(None, littoral)
+    if "communes" in st.session_state:
+        valides = set(options)
+        st.session_state["communes"] = [
+            code for code in st.session_state["communes"] if code in valides
         ]
 
-        with st.spinner("Chargement..."):
-            st.header(f"{departement_dep} - Bande {perimetre}")
-            col21, col22 = st.columns(2)
-            with col21:
-                st.metric(
-                    "Nombre de logements",
-                    get("nb_logt", code_dep, perimetre, "iddep"),
-                )
-                st.metric(
-                    "Estimation des logements",
-                    get("estim_logt", code_dep, perimetre, "iddep") + " €",
-                )
-                st.metric(
-                    "Surface urbanisée",
-                    get("surfaces_urba", code_dep, perimetre, "iddep") + " m2",
-                )
-            with col22:
-                st.metric(
-                    "Nombre de locaux d'activité",
-                    get("nb_loc_act", code_dep, perimetre, "iddep"),
-                )
-                st.metric(
-                    "Estimation bureaux/commerces",
-                    get("estim_bur_com", code_dep, perimetre, "iddep") + " €",
-                )
-                st.metric(
-                    "Surface NAF",
-                    get("surfaces_naf", code_dep, perimetre, "iddep") + " m2",
-                )
-
-        st.header("Enjeux concernées")
+    def libelle(code):
+        return f"{territoires.nom_commune(code)} ({code_departement(code)})"
 
-        with st.spinner("Chargement..."):
-            st.subheader("Logement")
-            col_occ_dep, col_cstr_dep = st.columns(2, gap="large")
-            with col_occ_dep:
-                st.plotly_chart(
-                    graphe_occupation_parc(code_dep, perimetre, "iddep"),
-                    use_container_width=True,
-                )
-            with col_cstr_dep:
-                st.plotly_chart(
-                    graphe_age_parc(code_dep, perimetre, "iddep"),
-                    use_container_width=True,
-                )
+    codes = st.multiselect(
+        "Choix des communes",
+        options,
+        format_func=libelle,
+        key="communes",
+        persist_state="page",
+    )
+    st.button(
+        "Ajouter les communes du département",
+        on_click=ajoute_communes,
+        args=(territoires.communes(coddep, littoral),),
+    )
+    return codes
 
-            col_foncier_dep, col_act_dep = st.columns(2, gap="large")
-            with col_foncier_dep:
-                st.subheader("Foncier")
-                st.plotly_chart(
-                    graphe_foncier(code_dep, perimetre, "iddep"),
-                    use_container_width=True,
-                )
-            with col_act_dep:
-                st.subheader("Activité")
-                col_hotel_dep, col_camping_dep = st.columns(2)
-                with col_hotel_dep:
-                    st.metric(
-                        "Hotels",
-                        get("nb_hotels", code_dep, perimetre, "iddep"),
-                    )
-                with col_camping_dep:
-                    st.metric(
-                        "Campings",
-                        get("nb_campings", code_dep, perimetre, "iddep"),
-                    )
-
-                col_commerce_dep, col_bureau_dep = st.columns(2)
-                with col_commerce_dep:
-                    st.metric(
-                        "Commerces",
-                        get("nb_commerces", code_dep, perimetre, "iddep"),
-                    )
-                with col_bureau_dep:
-                    st.metric(
-                        "Locaux de bureau",
-                        get("nb_bureaux", code_dep, perimetre, "iddep"),
-                    )
 
-                st.metric(
-                    "Autres locaux d'activité",
-                    get("nb_act_autres", code_dep, perimetre, "iddep"),
-                )
+def fiche_commune(code_insee, commune, perimetre):
+    chiffres = dict(
+        zip(INDICATEURS_CHIFFRES, gets(INDICATEURS_CHIFFRES, code_insee, perimetre))
+    )
 
-        st.header("Estimation des biens")
+    col1, col2 = st.columns(2, gap="large")
 
+    with col1:
+        st.header(f"Carte de situation - {commune}")
+        # Carte
         with st.spinner("Chargement..."):
-            st.subheader("Estimation des logements")
-            col_estim_dep, col_mai_dep, col_apt_dep, col_loyer_dep = st.columns(
-                4, gap="large"
+            if isinstance(code_insee, tuple):
+                (x_center, y_center), zoom_start = get_center_groupe(code_insee)
+                geojson = get_perimetre_groupe(code_insee)
+            else:
+                (x_center, y_center), zoom_start = get_center(code_insee)
+                geojson = get_perimetre(code_insee)
+            m = folium.Map(location=[y_center, x_center], zoom_start=zoom_start)
+            if geojson is not None:
+                folium.GeoJson(
+                    geojson, name=commune, style_function=style_perimetre
+                ).add_to(m)
+            # folium.GeoJson(json.loads(open(f"bande_200_d{code_dep}.geojson").read()), name="frange", style_function=style_recul).add_to(m)
+            with span("st_folium"):
+                map = st_folium(m, width=500, height=400, returned_objects=[])
+
+    with col2:
+        st.header(f"Principaux chiffres - Bande {perimetre}")
+        col21, col22 = st.columns(2)
+        with col21:
+            st.metric(
+                "Nombre de logements",
+                chiffres["nb_logt"],
             )
-            with col_estim_dep:
-                st.metric(
-                    "Ensemble des logements",
-                    get("estim_logt", code_dep, perimetre, "iddep") + " €",
-                )
-            with col_mai_dep:
-                st.metric(
-                    "Maisons",
-                    get("estim_maisons", code_dep, perimetre, "iddep") + " €",
-                )
-            with col_apt_dep:
-                st.metric(
-                    "Appartements",
-                    get("estim_appts", code_dep, perimetre, "iddep") + " €",
-                )
-            with col_loyer_dep:
-                st.metric(
-                    "Estimation des loyers percus",
-                    get("estim_loyer_loue", code_dep, perimetre, "iddep") + " €/mois",
-                )
+            st.metric(
+                "Estimation des logements",
+                chiffres["estim_logt"] + " €",
+            )
+            st.metric(
+                "Surface urbanisée",
+                chiffres["surfaces_urba"] + " m2",
+            )
+        with col22:
+            st.metric(
+                "Nombre de locaux d'activité",
+                chiffres["nb_loc_act"],
+            )
+            st.metric(
+                "Estimation bureaux/commerces",
+                chiffres["estim_bur_com"] + " €",
+            )
+            st.metric(
+                "Surface NAF",
+                chiffres["surfaces_naf"] + " m2",
+            )
+
+    st.header("Enjeux intersectés")
 
-            st.plotly_chart(
-                graphe_estimation_logement_taille(code_dep, perimetre, "iddep"),
+    with st.spinner("Chargement..."):
+        st.subheader("Logement")
+        col_occ, col_cstr = st.columns(2, gap="large")
+        with col_occ:
+            plotly_chart(
+                graphe_occupation_parc(code_insee, perimetre),
                 use_container_width=True,
             )
+        with col_cstr:
+            plotly_chart(
+                graphe_age_parc(code_insee, perimetre), use_container_width=True
+            )
 
-            st.subheader("Estimation des locaux d'activité")
-            col_estim_bureau_dep, col_estim_commerce_dep = st.columns(2, gap="large")
-            with col_estim_bureau_dep:
+        col_foncier, col_act = st.columns(2, gap="large")
+        with col_foncier:
+            st.subheader("Foncier")
+            plotly_chart(
+                graphe_foncier(code_insee, perimetre), use_container_width=True
+            )
+        with col_act:
+            st.subheader("Activité")
+            col_hotel, col_camping = st.columns(2)
+            with col_hotel:
                 st.metric(
-                    "Bureaux",
-                    get("estimation_bureaux", code_dep, perimetre, "iddep") + " €",
+                    "Hotels",
+                    chiffres["nb_hotels"],
                 )
-            with col_estim_commerce_dep:
+            with col_camping:
                 st.metric(
-                    "Commerces",
-                    get("estimation_commerces", code_dep, perimetre, "iddep") + " €",
+                    "Campings",
+                    chiffres["nb_campings"],
                 )
 
-    with tab_comm:
-        col_dep, col_com = st.columns(2)
+            col_commerce, col_bureau = st.columns(2)
+            with col_commerce:
+                st.metric(
+                    "Commerces",
+                    chiffres["nb_commerces"],
+                )
+            with col_bureau:
+                st.metric(
+                    "Locaux de bureau",
+                    chiffres["nb_bureaux"],
+                )
 
-        with col_dep:
-            departements = get_departements(perimetre)
-            departement = st.selectbox(
-                "Choix du département", [d["nom"] for d in departements]
+            st.metric(
+                "Autres locaux d'activité",
+                chiffres["nb_act_autres"],
             )
 
-        coddep = [d["code"] for d in departements if d["nom"] == departement][0]
-
-        with col_com:
-            col_comm, col_check = st.columns([0.6, 0.4])
-            with col_check:
-                littoral = st.checkbox("Riveraines mers et océans", value=True)
-            with col_comm:
-                communes = get_communes(coddep, perimetre, littoral)
-                commune = st.selectbox(
-                    "Choix de la commune", [c["nom"] for c in communes]
-                )
+    st.header("Estimation des biens")
 
-        code_insee = [c["code"] for c in communes if c["nom"] == commune][0]
+    with st.spinner("Chargement..."):
+        st.subheader("Estimation des logements")
+        col_estim, col_mai, col_apt, col_loyer = st.columns(4, gap="large")
+        with col_estim:
+            st.metric(
+                "Ensemble des logements",
+                chiffres["estim_logt"] + " €",
+            )
+        with col_mai:
+            st.metric(
+                "Maisons",
+                chiffres["estim_maisons"] + " €",
+            )
+        with col_apt:
+            st.metric(
+                "Appartements",
+                chiffres["estim_appts"] + " €",
+            )
+        with col_loyer:
+            st.metric(
+                "Estimation des loyers percus",
+                chiffres["estim_loyer_loue"] + " €/mois",
+            )
 
-        col1, col2 = st.columns(2, gap="large")
+        plotly_chart(
+            graphe_estimation_logement_taille(code_insee, perimetre),
+            use_container_width=True,
+        )
 
-        with col1:
-            st.header(f"Carte de situation - {commune}")
-            # Carte
-            with st.spinner("Chargement..."):
-                x_center, y_center = get_center(code_insee)
-                geojson = get_perimetre(code_insee)
-                m = folium.Map(location=[y_center, x_center], zoom_start=10)
-                folium.GeoJson(
-                    geojson, name=commune, style_function=style_perimetre
-                ).add_to(m)
-                # folium.GeoJson(json.loads(open(f"bande_200_d{code_dep}.geojson").read()), name="frange", style_function=style_recul).add_to(m)
-                map = st_folium(m, width=500, height=400)
+        st.subheader("Estimation des locaux d'activité")
+        col_estim_bureau, col_estim_commerce = st.columns(2, gap="large")
+        with col_estim_bureau:
+            st.metric(
+                "Bureaux",
+                chiffres["estimation_bureaux"] + " €",
+            )
+        with col_estim_commerce:
+            st.metric(
+                "Commerces",
+                chiffres["estimation_commerces"] + " €",
+            )
 
-        with col2:
-            st.header(f"Principaux chiffres - Bande {perimetre}")
-            col21, col22 = st.columns(2)
-            with col21:
-                st.metric(
-                    "Nombre de logements",
-                    get("nb_logt", code_insee, perimetre),
-                )
-                st.metric(
-                    "Estimation des logements",
-                    get("estim_logt", code_insee, perimetre) + " €",
-                )
-                st.metric(
-                    "Surface urbanisée",
-                    get("surfaces_urba", code_insee, perimetre) + " m2",
-                )
-            with col22:
-                st.metric(
-                    "Nombre de locaux d'activité",
-                    get("nb_loc_act", code_insee, perimetre),
-                )
-                st.metric(
-                    "Estimation bureaux/commerces",
-                    get("estim_bur_com", code_insee, perimetre) + " €",
-                )
-                st.metric(
-                    "Surface NAF",
-                    get("surfaces_naf", code_insee, perimetre) + " m2",
-                )
+    if not isinstance(code_insee, tuple):
+        comparaison_bandes(code_insee)
+
+    codes = code_insee if isinstance(code_insee, tuple) else (code_insee,)
+    departements = sorted({code_departement(code) for code in codes})
+    nom = f"{codes[0]}_{perimetre}" if len(codes) == 1 else f"selection_{perimetre}"
+    telechargement(
+        {
+            commune: (nom, lambda: extrait_communes(perimetre, codes=codes)),
+            "Communes du département": (
+                f"communes_{'_'.join(departements)}_{perimetre}",
+                lambda: extrait_communes(perimetre, departements=departements),
+            ),
+        },
+        "idcom",
+    )
 
-        st.header("Enjeux intersectés")
 
-        with st.spinner("Chargement..."):
-            st.subheader("Logement")
-            col_occ, col_cstr = st.columns(2, gap="large")
-            with col_occ:
-                st.plotly_chart(
-                    graphe_occupation_parc(code_insee, perimetre),
-                    use_container_width=True,
-                )
-            with col_cstr:
-                st.plotly_chart(
-                    graphe_age_parc(code_insee, perimetre), use_container_width=True
-                )
+with span("rerun", racine=True):
+    if check_password():
+        perimetre = st.selectbox(
+            "Choix de la distance au littoral (limite terre-mer)", PERIMETRES
+        )
 
-            col_foncier, col_act = st.columns(2, gap="large")
-            with col_foncier:
-                st.subheader("Foncier")
-                st.plotly_chart(
-                    graphe_foncier(code_insee, perimetre), use_container_width=True
-                )
-            with col_act:
-                st.subheader("Activité")
-                col_hotel, col_camping = st.columns(2)
-                with col_hotel:
-                    st.metric(
-                        "Hotels",
-                        get("nb_hotels", code_insee, perimetre),
-                    )
-                with col_camping:
-                    st.metric(
-                        "Campings",
-                        get("nb_campings", code_insee, perimetre),
-                    )
-
-                col_commerce, col_bureau = st.columns(2)
-                with col_commerce:
-                    st.metric(
-                        "Commerces",
-                        get("nb_commerces", code_insee, perimetre),
-                    )
-                with col_bureau:
-                    st.metric(
-                        "Locaux de bureau",
-                        get("nb_bureaux", code_insee, perimetre),
-                    )
+        tab_comm, tab_dep, tab_nat, tab_aav = st.tabs(
+            ["Commune", "Département", "National", "AAV"],
+            key="onglet",
+            on_change="rerun",
+        )
 
-                st.metric(
-                    "Autres locaux d'activité",
-                    get("nb_act_autres", code_insee, perimetre),
-                )
+        with tab_aav:
+            if tab_aav.open:
+                onglet_aav(perimetre)
 
-        st.header("Estimation des biens")
+        with tab_dep:
+            if tab_dep.open:
+                onglet_departement(perimetre)
 
-        with st.spinner("Chargement..."):
-            st.subheader("Estimation des logements")
-            col_estim, col_mai, col_apt, col_loyer = st.columns(4, gap="large")
-            with col_estim:
-                st.metric(
-                    "Ensemble des logements",
-                    get("estim_logt", code_insee, perimetre) + " €",
-                )
-            with col_mai:
-                st.metric(
-                    "Maisons",
-                    get("estim_maisons", code_insee, perimetre) + " €",
-                )
-            with col_apt:
-                st.metric(
-                    "Appartements",
-                    get("estim_appts", code_insee, perimetre) + " €",
-                )
-            with col_loyer:
-                st.metric(
-                    "Estimation des loyers percus",
-                    get("estim_loyer_loue", code_insee, perimetre) + " €/mois",
-                )
+        with tab_nat:
+            if tab_nat.open:
+                onglet_national(perimetre)
 
-            st.plotly_chart(
-                graphe_estimation_logement_taille(code_insee, perimetre),
-                use_container_width=True,
-            )
+        with tab_comm:
+            if tab_comm.open:
+                onglet_commune(perimetre)
 
-            st.subheader("Estimation des locaux d'activité")
-            col_estim_bureau, col_estim_commerce = st.columns(2, gap="large")
-            with col_estim_bureau:
-                st.metric(
-                    "Bureaux",
-                    get("estimation_bureaux", code_insee, perimetre) + " €",
-                )
-            with col_estim_commerce:
-                st.metric(
-                    "Commerces",
-                    get("estimation_commerces", code_insee, perimetre) + " €",
-                )
+if st.session_state.get("password_correct"):
+    profilage()
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE, "tools"))
+
+from client import GeoClient  # noqa: E402
+from stub_geo_api import serve  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def serveur():
+    serveur = serve(root=RACINE)
+    yield serveur
+    serveur.shutdown()
+
+
+@pytest.fixture
+def api(serveur):
+    # bouchon remis à zéro pour chaque test
+    api = serveur.api
+    api.latency, api.error_rate, api.pannes, api.requests = 0.0, 0.0, 0, 0
+    return api
+
+
+def client(serveur, **options):
+    options = {"retries": 0, "backoff": 0, **options}
+    return GeoClient(f"http://127.0.0.1:{serveur.server_address[1]}", **options)
+
+
+def communes(api, n):
+    return [f"/communes/{code}" for code in sorted(api.communes)[:n]]
+
+
+def test_reprise_apres_erreur_serveur(serveur, api):
+    api.pannes = 2
+    geo = client(serveur, retries=2)
+    assert geo.get_json("/departements")
+    assert api.requests == 3
+    assert geo.metrics()["retries"] == 2
+
+
+def test_reprise_apres_timeout(serveur, api):
+    api.latency = 0.3
+    geo = client(serveur, retries=1, timeout=(1, 0.05))
+    assert geo.get_json("/departements") is None
+    assert geo.metrics()["requests"] == 2
+    assert geo.metrics()["errors"] == 1
+
+
+def test_disjoncteur_ouvert_puis_semi_ouvert(serveur, api):
+    api.error_rate = 1.0
+    geo = client(serveur, failure_threshold=2, reset_after=0.2)
+    geo.get_json("/departements")
+    assert not geo.circuit_open()
+    geo.get_json("/departements")
+    assert geo.circuit_open()
+
+    # semi-ouvert : une requête de test, un nouvel échec rouvre aussitôt
+    time.sleep(0.25)
+    requetes = api.requests
+    assert geo.get_json("/departements") is None
+    assert api.requests == requetes + 1
+    assert geo.circuit_open()
+
+    # semi-ouvert : la requête de test réussit, le disjoncteur se referme
+    time.sleep(0.25)
+    api.error_rate = 0.0
+    assert geo.get_json("/departements")
+    assert not geo.circuit_open()
+
+
+def test_rejet_immediat_disjoncteur_ouvert(serveur, api):
+    api.error_rate = 1.0
+    geo = client(serveur, failure_threshold=1, reset_after=60)
+    geo.get_json("/departements")
+    api.latency = 1.0
+    requetes = api.requests
+    debut = time.perf_counter()
+    assert geo.get_json("/departements") is None
+    assert time.perf_counter() - debut < 0.1
+    assert api.requests == requetes
+    assert geo.metrics()["rejected"] == 1
+
+
+def test_cache_lru(serveur, api):
+    a, b, c = communes(api, 3)
+    geo = client(serveur, cache_size=2)
+    geo.get_json(a)
+    geo.get_json(b)
+    assert geo.get_json(a)
+    assert api.requests == 2
+    assert geo.metrics()["hits"] == 1
+
+    # b, le moins récemment lu, sort du cache
+    geo.get_json(c)
+    assert geo.cached(a) and geo.cached(c)
+    assert not geo.cached(b)
+
+
+def test_prefetch_sans_doublon(serveur, api):
+    api.latency = 0.2
+    geo = client(serveur)
+    premiers = geo.prefetch(["/departements", "/departements"])
+    suivants = geo.prefetch(["/departements"])
+    assert premiers[0] is premiers[1] is suivants[0]
+    assert premiers[0].result()
+    assert api.requests == 1
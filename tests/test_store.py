@@ -0,0 +1,63 @@
+import pandas as pd
+
+from store import (
+    IndicatorStore,
+    RollupCube,
+    derive,
+    format_serie,
+    format_val,
+    to_number,
+)
+
+
+def store():
+    df = pd.DataFrame(
+        {
+            "index": [0, 1, 2],
+            "idcom": ["A", "B", "C"],
+            "nb_campings": [8, 12, 15],
+        }
+    )
+    return IndicatorStore(derive(df))
+
+
+def test_regroupement_secret_si_un_territoire_est_secret():
+    # A masqué, B publié : le total A + B ne doit pas redonner A par soustraction
+    indicateurs = store()
+    assert indicateurs.values(["nb_campings"], "A") == [None]
+    assert indicateurs.values(["nb_campings"], "B") == [12]
+    assert indicateurs.values(["nb_campings"], ("A", "B")) == [None]
+    assert indicateurs.textes(["nb_campings"], ("A", "B")) == ["< 11"]
+
+
+def test_regroupement_publie_sans_territoire_secret():
+    indicateurs = store()
+    assert indicateurs.values(["nb_campings"], ("B", "C")) == [27]
+    assert indicateurs.textes(["nb_campings"], ("B", "C")) == ["27"]
+
+
+def test_format_serie_comme_format_val():
+    # séparateur de milliers sur la partie entière seulement
+    valeurs = [15.2345, 1234.5678, 1234567, 12, 0.5]
+    attendu = [format_val(to_number(float(v))) for v in valeurs]
+    assert format_serie(pd.Series(valeurs)).tolist() == attendu
+    assert attendu[:3] == ["15.2345", "1 234.5678", "1 234 567"]
+
+
+def test_ecart_avec_table_publiee_signale_sans_erreur():
+    communes = pd.DataFrame(
+        {
+            "index": [0, 1],
+            "idcom": ["29001", "29002"],
+            "iddep": ["29", "29"],
+            "comm_decret": ["oui", "non"],
+            "comm_litt": ["oui", "oui"],
+            "nb_campings": [20, 30],
+        }
+    )
+    publiee = pd.DataFrame({"iddep": ["29"], "nb_campings": [49]})
+    cube = RollupCube({"200m": communes}, {"200m": publiee}, prepare=derive)
+    assert cube.ecarts == [
+        "indicateurs_dpt_200m incohérente avec le cumul des communes : ['nb_campings']"
+    ]
+    assert cube.store("200m", "iddep").values(["nb_campings"], "29") == [50]
@@ -0,0 +1,274 @@
+# Mesure la durée des reruns des applications, sans navigateur (AppTest) et
+# avec la geo API bouchonnée (tools/stub_geo_api.py) :
+#   python tools/bench_reruns.py
+#   python tools/bench_reruns.py --departements 5 --communes 2 --compare bench/abc1234.json
+#
+# Scénario, par périmètre : passage sur chaque onglet, puis dans l'onglet
+# chaque département, un échantillon de communes et chaque thème de carte.
+# Le scénario est joué deux fois : caches Streamlit vidés (froid), puis
+# caches remplis (chaud). Chaque application est mesurée dans son propre
+# processus (mémoire et caches non partagés). Résultats dans bench/<commit>.json.
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+APPS = ["streamlit_app.py", "streamlit_app_v2024.py"]
+
+LIBELLE_PERIMETRE = "Choix de la distance au littoral (limite terre-mer)"
+SELECTEURS_DEPARTEMENT = ["departement", "departement_dep"]
+SELECTEURS_THEME = ["indicateur_carto", "methode_carto"]
+
+
+def stats(durees):
+    if not durees:
+        return {"n": 0}
+    durees = sorted(durees)
+    quantiles = (
+        statistics.quantiles(durees, n=100, method="inclusive")
+        if len(durees) > 1
+        else durees
+    )
+    return {
+        "n": len(durees),
+        "mean": round(statistics.fmean(durees), 4),
+        "p50": round(statistics.median(durees), 4),
+        "p95": round(quantiles[94] if len(durees) > 1 else durees[0], 4),
+        "max": round(durees[-1], 4),
+        "total": round(sum(durees), 3),
+    }
+
+
+def selectbox(at, key):
+    try:
+        return at.selectbox(key=key)
+    except KeyError:
+        return None
+
+
+class Banc:
+    def __init__(self, app, departements=None, communes=3, seed=0, timeout=120):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(os.path.join(RACINE, app), default_timeout=timeout)
+        self.at.secrets["password"] = "bench"
+        self.at.session_state["password_correct"] = True
+        self.departements = departements
+        self.communes = communes
+        self.seed = seed
+        self.mesures = []
+        self.erreurs = []
+        self.onglet = None
+
+    def run(self, etape, detail=""):
+        if self.onglet is not None:
+            # AppTest ne renvoie pas l'onglet ouvert comme le ferait le
+            # navigateur : il est réaffirmé avant chaque rerun
+            self.at.session_state["onglet"] = self.onglet
+        debut = time.perf_counter()
+        self.at.run()
+        duree = time.perf_counter() - debut
+        self.mesures.append((etape, duree))
+        if self.at.exception:
+            self.erreurs.append(
+                {
+                    "etape": etape,
+                    "detail": detail,
+                    "exception": self.at.exception[0].value,
+                }
+            )
+        return duree
+
+    def choisir(self, widget, valeur, etape):
+        widget.set_value(valeur)
+        self.run(etape, str(valeur))
+
+    def perimetre(self):
+        return next(sb for sb in self.at.selectbox if sb.label == LIBELLE_PERIMETRE)
+
+    def scenario(self):
+        self.mesures = []
+        self.onglet = None
+        premier = self.run("premier_affichage")
+        rng = random.Random(self.seed)
+        for perimetre in self.perimetre().options:
+            self.choisir(self.perimetre(), perimetre, "perimetre")
+            for onglet in [t.label for t in self.at.tabs]:
+                self.onglet = onglet
+                self.run("onglet", onglet)
+                self.parcourir_departements(rng)
+                for key in SELECTEURS_THEME:
+                    theme = selectbox(self.at, key)
+                    for valeur in theme.options if theme else []:
+                        self.choisir(selectbox(self.at, key), valeur, "theme")
+        return premier
+
+    def parcourir_departements(self, rng):
+        for key in SELECTEURS_DEPARTEMENT:
+            departement = selectbox(self.at, key)
+            if departement is None:
+                continue
+            options = departement.options[: self.departements]
+            for valeur in options:
+                self.choisir(selectbox(self.at, key), valeur, "departement")
+                commune = selectbox(self.at, "commune")
+                if commune is None:
+                    continue
+                echantillon = rng.sample(
+                    commune.options, min(self.communes, len(commune.options))
+                )
+                for nom in echantillon:
+                    self.choisir(selectbox(self.at, "commune"), nom, "commune")
+
+    def resultats(self):
+        par_etape = {}
+        for etape, duree in self.mesures:
+            par_etape.setdefault(etape, []).append(duree)
+        return {
+            "reruns": stats([d for _, d in self.mesures]),
+            "etapes": {etape: stats(d) for etape, d in sorted(par_etape.items())},
+        }
+
+
+def mesurer(app, departements, communes, seed, latency, traces):
+    import streamlit as st
+
+    from stub_geo_api import serve
+
+    os.chdir(RACINE)
+    serveur = serve(latency=latency)
+    os.environ["GEO_API_URL"] = f"http://127.0.0.1:{serveur.server_address[1]}"
+    if traces:
+        tracemalloc.start()
+
+    banc = Banc(app, departements, communes, seed)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    premier_froid = banc.scenario()
+    froid = banc.resultats()
+    requetes_froid = serveur.api.requests
+    premier_chaud = banc.scenario()
+    chaud = banc.resultats()
+
+    resultat = {
+        "cold": dict(froid, premier_affichage=round(premier_froid, 4)),
+        "warm": dict(chaud, premier_affichage=round(premier_chaud, 4)),
+        "geo_api_requests": {
+            "cold": requetes_froid,
+            "warm": serveur.api.requests - requetes_froid,
+        },
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "errors": banc.erreurs,
+    }
+    if traces:
+        resultat["peak_traced_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+    serveur.shutdown()
+    return resultat
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def comparer(actuel, reference):
+    for app, mesures in actuel["apps"].items():
+        if app not in reference["apps"]:
+            continue
+        for phase in ["cold", "warm"]:
+            for cle in ["p50", "p95"]:
+                avant = reference["apps"][app][phase]["reruns"].get(cle)
+                apres = mesures[phase]["reruns"].get(cle)
+                if avant and apres:
+                    print(
+                        f"{app} {phase} {cle}: {avant:.3f}s -> {apres:.3f}s"
+                        f" ({(apres - avant) / avant:+.0%})"
+                    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", action="append", choices=APPS)
+    parser.add_argument("--departements", type=int, default=None)
+    parser.add_argument("--communes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        resultat = mesurer(
+            args.app[0],
+            args.departements,
+            args.communes,
+            args.seed,
+            args.latency,
+            args.tracemalloc,
+        )
+        print(json.dumps(resultat))
+        return
+
+    resultats = {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parametres": {
+            "departements": args.departements,
+            "communes": args.communes,
+            "seed": args.seed,
+            "latency": args.latency,
+        },
+        "apps": {},
+    }
+    for app in args.app or APPS:
+        commande = [sys.executable, os.path.abspath(__file__), "--worker", "--app", app]
+        commande += ["--communes", str(args.communes), "--seed", str(args.seed)]
+        commande += ["--latency", str(args.latency)]
+        if args.departements is not None:
+            commande += ["--departements", str(args.departements)]
+        if args.tracemalloc:
+            commande.append("--tracemalloc")
+        sortie = subprocess.run(
+            commande, cwd=RACINE, check=True, capture_output=True, text=True
+        ).stdout
+        resultats["apps"][app] = mesures = json.loads(sortie.splitlines()[-1])
+        print(
+            f"{app}: premier affichage {mesures['cold']['premier_affichage']:.2f}s"
+            f" (froid) / {mesures['warm']['premier_affichage']:.2f}s (chaud),"
+            f" rerun p50 {mesures['warm']['reruns']['p50']:.3f}s"
+            f" p95 {mesures['warm']['reruns']['p95']:.3f}s (chaud),"
+            f" {mesures['peak_rss_kb'] // 1024} Mo max,"
+            f" {len(mesures['errors'])} erreur(s)"
+        )
+
+    output = args.output or os.path.join(RACINE, "bench", f"{resultats['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"résultats écrits dans {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            comparer(resultats, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# Test de charge : lance l'application en local (streamlit run) avec la geo
+# API bouchonnée, puis simule N sessions de navigateur simultanées sur le
+# websocket de Streamlit (/_stcore/stream, messages protobuf BackMsg /
+# ForwardMsg) :
+#   python tools/bench_sessions.py --sessions 1,5,10,20 --steps 30
+#
+# Chaque session se connecte, saisit le mot de passe (check_password), puis
+# navigue au hasard : périmètre, onglet, département, commune. Les widgets
+# d'un fragment déclenchent un rerun du seul fragment, comme le navigateur.
+# Par palier de sessions : débit (reruns/s), latences p50/p95/p99, erreurs,
+# CPU et RSS du serveur (lus dans /proc). Résultats dans
+# bench/sessions-<commit>.json.
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_reruns import RACINE, commit, stats  # noqa: E402
+from stub_geo_api import serve  # noqa: E402
+
+# widgets parcourus et poids de chaque action dans la navigation simulée
+NAVIGATION = {
+    "Choix de la distance au littoral (limite terre-mer)": 1,
+    "Choix du département": 3,
+    "Choix d'un département": 3,
+    "Choix de la commune": 6,
+    "Thème de la carte": 2,
+    "Classes de la carte": 1,
+}
+POIDS_ONGLET = 1
+WIDGETS = ["selectbox", "text_input", "checkbox"]
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Serveur:
+    # `streamlit run` dans un sous-processus, mot de passe dans un fichier de
+    # secrets temporaire
+    def __init__(self, app, geo_api_url, password):
+        self.port = port_libre()
+        self.dossier = tempfile.TemporaryDirectory()
+        secrets = os.path.join(self.dossier.name, "secrets.toml")
+        with open(secrets, "w", encoding="utf-8") as f:
+            f.write(f"password = {json.dumps(password)}\n")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "streamlit",
+                "run",
+                app,
+                "--server.headless=true",
+                f"--server.port={self.port}",
+                "--server.address=127.0.0.1",
+                f"--secrets.files={secrets}",
+                "--browser.gatherUsageStats=false",
+            ],
+            cwd=RACINE,
+            env=dict(os.environ, GEO_API_URL=geo_api_url),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def attendre(self, timeout=60):
+        fin = time.monotonic() + timeout
+        while time.monotonic() < fin:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError("le serveur streamlit s'est arrêté")
+                time.sleep(0.2)
+        raise TimeoutError("le serveur streamlit ne répond pas")
+
+    def arreter(self):
+        self.process.terminate()
+        self.process.wait(10)
+        self.dossier.cleanup()
+
+
+class Sonde:
+    # échantillonne CPU (%) et RSS (Mo) d'un processus via /proc (Linux)
+    def __init__(self, pid, periode=0.5):
+        self.pid = pid
+        self.periode = periode
+        self.cpu = []
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+
+    def _temps_cpu(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            champs = f.read().rsplit(")", 1)[1].split()
+        return (int(champs[11]) + int(champs[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for ligne in f:
+                if ligne.startswith("VmRSS:"):
+                    return int(ligne.split()[1]) / 1024
+
+    def _boucle(self):
+        precedent, debut = self._temps_cpu(), time.monotonic()
+        while not self._stop.wait(self.periode):
+            cpu, maintenant = self._temps_cpu(), time.monotonic()
+            self.cpu.append(100 * (cpu - precedent) / (maintenant - debut))
+            self.rss.append(self._rss())
+            precedent, debut = cpu, maintenant
+
+    def __enter__(self):
+        if os.path.exists(f"/proc/{self.pid}/stat"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def resultats(self):
+        if not self.cpu:
+            return {}
+        return {
+            "cpu_mean": round(statistics.fmean(self.cpu), 1),
+            "cpu_max": round(max(self.cpu), 1),
+            "rss_max_mb": round(max(self.rss), 1),
+        }
+
+
+class Session:
+    # un onglet de navigateur : état des widgets tenu côté client et renvoyé
+    # à chaque rerun
+    def __init__(self, url, password, rng, timeout=120):
+        self.url = url
+        self.password = password
+        self.rng = rng
+        self.timeout = timeout
+        self.widgets = {}
+        self.onglets = None
+        self.etats = {}
+        self.latences = []
+        self.erreurs = 0
+        self.exceptions = []
+
+    def __enter__(self):
+        origine = self.url.replace("ws://", "http://").split("/_stcore")[0]
+        self._connexion = connect(
+            self.url,
+            subprotocols=["streamlit"],
+            origin=origine,
+            max_size=None,
+            open_timeout=self.timeout,
+        )
+        self.ws = self._connexion.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._connexion.__exit__(*exc)
+
+    def rerun(self, fragment_id=""):
+        msg = BackMsg()
+        etat = msg.rerun_script
+        etat.query_string = ""
+        etat.page_script_hash = ""
+        etat.fragment_id = fragment_id
+        for widget in self.etats.values():
+            etat.widget_states.widgets.append(widget)
+        if not fragment_id:
+            self.widgets = {}
+            self.onglets = None
+        debut = time.perf_counter()
+        self.ws.send(msg.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(self.ws.recv(timeout=self.timeout))
+            kind = forward.WhichOneof("type")
+            if kind == "delta":
+                self._delta(forward.delta)
+            elif kind == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        self.latences.append(time.perf_counter() - debut)
+
+    def _delta(self, delta):
+        if delta.WhichOneof("type") == "add_block":
+            block = delta.add_block
+            if block.WhichOneof("type") == "tab_container" and block.id:
+                self.onglets = (block.id, delta.fragment_id, [])
+            elif block.WhichOneof("type") == "tab" and self.onglets is not None:
+                self.onglets[2].append(block.tab.label)
+            return
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.erreurs += 1
+        elif kind in WIDGETS:
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = (kind, widget, delta.fragment_id)
+            etat = self.etats.get(widget.id)
+            if kind == "selectbox" and etat and etat.string_value not in widget.options:
+                # option disparue (autre département) : le navigateur revient
+                # à la valeur par défaut
+                del self.etats[widget.id]
+
+    def saisir(self, label, valeur):
+        kind, widget, fragment_id = self.widgets[label]
+        etat = self.etats.setdefault(widget.id, self._etat(widget.id))
+        if kind == "checkbox":
+            etat.bool_value = valeur
+        else:
+            etat.string_value = valeur
+        self.rerun(fragment_id)
+
+    def onglet(self, label):
+        block_id, fragment_id, _ = self.onglets
+        self.etats.setdefault(block_id, self._etat(block_id)).string_value = label
+        self.rerun(fragment_id)
+
+    @staticmethod
+    def _etat(widget_id):
+        etat = WidgetState()
+        etat.id = widget_id
+        return etat
+
+    def connexion(self):
+        self.rerun()
+        if "Password" in self.widgets:
+            self.saisir("Password", self.password)
+
+    def etape(self):
+        actions = [
+            (label, poids)
+            for label, poids in NAVIGATION.items()
+            if label in self.widgets and self.widgets[label][1].options
+        ]
+        if self.onglets and len(self.onglets[2]) > 1:
+            actions.append((None, POIDS_ONGLET))
+        if not actions:
+            self.rerun()
+            return
+        label = self.rng.choices(
+            [a for a, _ in actions], weights=[p for _, p in actions]
+        )[0]
+        if label is None:
+            self.onglet(self.rng.choice(self.onglets[2]))
+        else:
+            self.saisir(label, self.rng.choice(list(self.widgets[label][1].options)))
+
+
+def parcours(url, password, steps, seed, resultats, verrou):
+    session = Session(url, password, random.Random(seed))
+    try:
+        with session:
+            session.connexion()
+            for _ in range(steps):
+                session.etape()
+    except Exception as exc:
+        # harnais ou protocole en défaut : trace sur stderr, résumé dans les
+        # résultats
+        with verrou:
+            traceback.print_exc()
+        session.erreurs += 1
+        session.exceptions.append(repr(exc))
+    with verrou:
+        resultats.append(session)
+
+
+def palier(url, password, sessions, steps, seed, pid):
+    resultats, verrou = [], threading.Lock()
+    threads = [
+        threading.Thread(
+            target=parcours,
+            args=(url, password, steps, seed + i, resultats, verrou),
+        )
+        for i in range(sessions)
+    ]
+    with Sonde(pid) as sonde:
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+    latences = [l for s in resultats for l in s.latences]
+    latence = stats(latences)
+    if len(latences) > 1:
+        latence["p99"] = round(
+            statistics.quantiles(latences, n=100, method="inclusive")[98], 4
+        )
+    return {
+        "sessions": sessions,
+        "duree": round(duree, 2),
+        "reruns": len(latences),
+        "debit": round(len(latences) / duree, 2),
+        "latence": latence,
+        "erreurs": sum(s.erreurs for s in resultats),
+        "exceptions": [exc for s in resultats for exc in s.exceptions],
+        **sonde.resultats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--sessions", default="1,5,10,20")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--password", default="charge")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    api = serve(root=RACINE, latency=args.latency)
+    serveur = Serveur(
+        args.app, f"http://127.0.0.1:{api.server_address[1]}", args.password
+    )
+    resultats = {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "app": args.app,
+        "parametres": {"steps": args.steps, "seed": args.seed, "latency": args.latency},
+        "paliers": [],
+    }
+    try:
+        serveur.attendre()
+        url = f"ws://127.0.0.1:{serveur.port}/_stcore/stream"
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            mesure = palier(
+                url, args.password, sessions, args.steps, args.seed, serveur.process.pid
+            )
+            resultats["paliers"].append(mesure)
+            print(
+                f"{sessions} session(s) : {mesure['debit']} reruns/s,"
+                f" p50 {mesure['latence'].get('p50', 0):.3f}s"
+                f" p95 {mesure['latence'].get('p95', 0):.3f}s"
+                f" p99 {mesure['latence'].get('p99', 0):.3f}s,"
+                f" CPU {mesure.get('cpu_mean', '-')} %,"
+                f" RSS {mesure.get('rss_max_mb', '-')} Mo,"
+                f" {mesure['erreurs']} erreur(s)"
+            )
+    finally:
+        serveur.arreter()
+        api.shutdown()
+
+    output = args.output or os.path.join(
+        RACINE, "bench", f"sessions-{resultats['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"résultats écrits dans {output}")
+
+
+if __name__ == "__main__":
+    main()
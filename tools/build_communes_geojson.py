@@ -0,0 +1,55 @@
+# Construit communes.geojson (nom, code, contour des communes présentes dans
+# indicateurs_tdc.sqlite3) à partir de geo.api.gouv.fr (ou de GEO_API_URL).
+# A lancer depuis la racine du dépôt : python tools/build_communes_geojson.py
+import json
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client import GeoClient  # noqa: E402
+
+PERIMETRES = ["200m", "1000m", "10000m"]
+
+
+def arrondi(coordinates, precision=5):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(c, precision) for c in coordinates]
+    return [arrondi(c, precision) for c in coordinates]
+
+
+def communes_disponibles(conn):
+    union = " UNION ".join(
+        f"SELECT DISTINCT iddep, idcom FROM indicateurs_com_{p}" for p in PERIMETRES
+    )
+    communes = {}
+    for iddep, idcom in conn.execute(union):
+        communes.setdefault(iddep.lstrip("0").zfill(2), set()).add(idcom)
+    return communes
+
+
+def main(output="communes.geojson"):
+    conn = sqlite3.connect("indicateurs_tdc.sqlite3")
+    client = GeoClient(timeout=(3.05, 60), cache_size=0)
+    features = []
+    for departement, codes in sorted(communes_disponibles(conn).items()):
+        communes = client.get_json(
+            f"/departements/{departement}/communes"
+            "?fields=nom,code,codeDepartement,contour&format=geojson&geometry=contour"
+        )
+        if communes is None:
+            raise RuntimeError(f"communes du département {departement} indisponibles")
+        for feature in communes["features"]:
+            if feature["properties"]["code"] in codes:
+                feature["geometry"]["coordinates"] = arrondi(
+                    feature["geometry"]["coordinates"]
+                )
+                features.append(feature)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    print(f"{len(features)} communes écrites dans {output}")
+
+
+if __name__ == "__main__":
+    main()
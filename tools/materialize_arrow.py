@@ -0,0 +1,27 @@
+# Matérialise les tables de indicateurs_tdc.sqlite3 en fichiers Arrow IPC
+# (dossier arrow/ ou TDC_ARROW_DIR), lus par le backend TDC_BACKEND=arrow.
+# Le backend les régénère de lui-même si la base change ; ce script permet de
+# les préparer au déploiement :
+#   python tools/materialize_arrow.py
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ARROW_DIR, DB_PATH, materialise  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--output", default=ARROW_DIR)
+    args = parser.parse_args()
+    materialise(args.db, args.output)
+    for nom in sorted(os.listdir(args.output)):
+        taille = os.path.getsize(os.path.join(args.output, nom)) // 1024
+        print(f"{nom:<32} {taille:>6} ko")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Mémoire des tables d'indicateurs chargées telles quelles puis avec le schéma
+# de store.SCHEMA (colonnes dérivées comprises) :
+#   python tools/memory_report.py
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import compacte, derive, memoire  # noqa: E402
+
+PERIMETRES = ["200m", "1000m", "10000m"]
+TABLES = [f"indicateurs_{niveau}_{p}" for niveau in ["com", "dpt"] for p in PERIMETRES]
+
+
+def ko(octets):
+    return f"{octets / 1024:8.0f} ko"
+
+
+def main(db="indicateurs_tdc.sqlite3"):
+    conn = sqlite3.connect(db)
+    totaux = [0, 0, 0, 0]
+    print(
+        f"{'table':26} {'brut':>11} {'schéma':>11}"
+        f" {'brut+dér.':>11} {'schéma+dér.':>11}"
+    )
+    for table in TABLES:
+        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        for col in ["idcom", "iddep"]:
+            if col in df:
+                df[col] = df[col].astype(str)
+        compact = compacte(df)
+        tailles = [
+            memoire(df),
+            memoire(compact),
+            memoire(derive(df)),
+            memoire(derive(compact)),
+        ]
+        totaux = [t + n for t, n in zip(totaux, tailles)]
+        print(f"{table:26} " + " ".join(ko(t) for t in tailles))
+    print(f"{'total':26} " + " ".join(ko(t) for t in totaux))
+    print(
+        f"gain : {1 - totaux[1] / totaux[0]:.0%} sur les tables,"
+        f" {1 - totaux[3] / totaux[2]:.0%} avec les colonnes dérivées"
+    )
+
+
+if __name__ == "__main__":
+    main()
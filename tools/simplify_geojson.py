@@ -0,0 +1,164 @@
+# Génère les versions simplifiées (une par niveau de zoom de geo.NIVEAUX_ZOOM)
+# de departement.geojson et aav.geojson :
+#   python tools/simplify_geojson.py
+#
+# La simplification respecte la topologie : les contours sont découpés en arcs
+# entre les sommets partagés par plusieurs polygones, chaque arc est simplifié
+# une seule fois (Douglas-Peucker), si bien que deux voisins gardent une
+# frontière commune identique, sans trou ni chevauchement.
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import NIVEAUX_ZOOM, simplified_path  # noqa: E402
+
+SOURCES = ["departement.geojson", "aav.geojson"]
+
+
+def key(point):
+    return round(point[0], 7), round(point[1], 7)
+
+
+def distance(p, a, b):
+    (x, y), (xa, ya), (xb, yb) = p, a, b
+    dx, dy = xb - xa, yb - ya
+    if dx == 0 and dy == 0:
+        return ((x - xa) ** 2 + (y - ya) ** 2) ** 0.5
+    t = max(0, min(1, ((x - xa) * dx + (y - ya) * dy) / (dx * dx + dy * dy)))
+    return ((x - xa - t * dx) ** 2 + (y - ya - t * dy) ** 2) ** 0.5
+
+
+def douglas_peucker(points, tolerance):
+    garde = [False] * len(points)
+    garde[0] = garde[-1] = True
+    pile = [(0, len(points) - 1)]
+    while pile:
+        debut, fin = pile.pop()
+        dmax, imax = 0, None
+        for i in range(debut + 1, fin):
+            d = distance(points[i], points[debut], points[fin])
+            if d > dmax:
+                dmax, imax = d, i
+        if imax is not None and dmax > tolerance:
+            garde[imax] = True
+            pile += [(debut, imax), (imax, fin)]
+    return [p for p, g in zip(points, garde) if g]
+
+
+def polygons(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def rings(features):
+    for feature in features:
+        for polygon in polygons(feature["geometry"]):
+            for ring in polygon:
+                yield ring[:-1]
+
+
+def jonctions(features):
+    # sommets où change l'ensemble des anneaux qui les partagent
+    proprietaires = {}
+    for i, ring in enumerate(rings(features)):
+        for point in ring:
+            proprietaires.setdefault(key(point), set()).add(i)
+    fixes = set()
+    for ring in rings(features):
+        n = len(ring)
+        for i, point in enumerate(ring):
+            courant = proprietaires[key(point)]
+            if (
+                courant != proprietaires[key(ring[i - 1])]
+                or courant != proprietaires[key(ring[(i + 1) % n])]
+            ):
+                fixes.add(key(point))
+    return fixes
+
+
+class Simplificateur:
+    def __init__(self, features, tolerance):
+        self.tolerance = tolerance
+        self.fixes = jonctions(features)
+        self.arcs = {}
+
+    def arc(self, points):
+        cle = tuple(key(p) for p in points)
+        inverse = cle[::-1]
+        if inverse < cle:
+            return self.arc(points[::-1])[::-1]
+        if cle not in self.arcs:
+            self.arcs[cle] = douglas_peucker(points, self.tolerance)
+        return self.arcs[cle]
+
+    def ring(self, ring):
+        points = ring[:-1]
+        coupures = [i for i, p in enumerate(points) if key(p) in self.fixes]
+        if not coupures:
+            # île : coupée au premier sommet et au sommet le plus éloigné
+            loin = max(
+                range(len(points)),
+                key=lambda i: distance(points[i], points[0], points[0]),
+            )
+            coupures = [0, loin] if loin else [0]
+        debut = coupures[0]
+        points = points[debut:] + points[:debut]
+        coupures = [i - debut for i in coupures] + [len(points)]
+        points = points + points[:1]
+        resultat = []
+        for a, b in zip(coupures, coupures[1:]):
+            resultat += self.arc(points[a : b + 1])[:-1]
+        resultat.append(resultat[0])
+        return resultat if len(resultat) >= 4 else None
+
+    def geometry(self, geometry, precision):
+        resultat = []
+        for polygon in polygons(geometry):
+            exterieur = self.ring(polygon[0])
+            if exterieur is None:
+                continue
+            trous = [t for t in map(self.ring, polygon[1:]) if t is not None]
+            resultat.append(
+                [
+                    [[round(x, precision), round(y, precision)] for x, y in r]
+                    for r in [exterieur] + trous
+                ]
+            )
+        if not resultat:
+            # territoire plus petit que la tolérance : contour d'origine conservé
+            resultat = [
+                [
+                    [
+                        [round(x, precision), round(y, precision)]
+                        for x, y in polygons(geometry)[0][0]
+                    ]
+                ]
+            ]
+        if len(resultat) == 1:
+            return {"type": "Polygon", "coordinates": resultat[0]}
+        return {"type": "MultiPolygon", "coordinates": resultat}
+
+
+def simplify(source, zoom, precision=4):
+    with open(source, encoding="utf-8") as f:
+        collection = json.load(f)
+    simplificateur = Simplificateur(collection["features"], NIVEAUX_ZOOM[zoom])
+    for feature in collection["features"]:
+        feature["geometry"] = simplificateur.geometry(feature["geometry"], precision)
+    destination = simplified_path(source, zoom)
+    with open(destination, "w", encoding="utf-8") as f:
+        json.dump(collection, f, separators=(",", ":"), ensure_ascii=False)
+    return destination
+
+
+if __name__ == "__main__":
+    for source in SOURCES:
+        for zoom in NIVEAUX_ZOOM:
+            destination = simplify(source, zoom)
+            print(
+                f"{destination}: {os.path.getsize(source) // 1024} ko"
+                f" -> {os.path.getsize(destination) // 1024} ko"
+            )
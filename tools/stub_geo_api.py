@@ -0,0 +1,145 @@
+# Bouchon local de geo.api.gouv.fr (départements, communes, bbox, contours),
+# pour les tests de charge et les mesures hors réseau :
+#   python tools/stub_geo_api.py --port 8765 --latency 0.05
+#   GEO_API_URL=http://localhost:8765 streamlit run streamlit_app.py
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import GeoReference, code_departement  # noqa: E402
+
+PERIMETRES = ["200m", "1000m", "10000m"]
+
+
+def load_communes(db="indicateurs_tdc.sqlite3"):
+    conn = sqlite3.connect(db)
+    union = " UNION ".join(
+        f"SELECT DISTINCT idcom, libcom FROM indicateurs_com_{p}" for p in PERIMETRES
+    )
+    communes = dict(conn.execute(union).fetchall())
+    conn.close()
+    return communes
+
+
+def carre(box, code, taille=0.05):
+    # emprise fictive mais stable d'une commune, dans celle de son département
+    xmin, ymin, xmax, ymax = box
+    h = zlib.crc32(code.encode())
+    x = xmin + (xmax - xmin - taille) * ((h & 0xFFFF) / 0xFFFF)
+    y = ymin + (ymax - ymin - taille) * ((h >> 16) / 0xFFFF)
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [[x, y], [x + taille, y], [x + taille, y + taille], [x, y + taille], [x, y]]
+        ],
+    }
+
+
+class StubGeoApi:
+    def __init__(self, root=".", latency=0.0, error_rate=0.0):
+        self.reference = GeoReference.from_files(
+            os.path.join(root, "departement.geojson"),
+            os.path.join(root, "communes.geojson"),
+        )
+        self.communes = load_communes(os.path.join(root, "indicateurs_tdc.sqlite3"))
+        self.latency = latency
+        self.error_rate = error_rate
+        # nombre de prochaines requêtes en erreur 503 (tests de reprise)
+        self.pannes = 0
+        self.requests = 0
+
+    def commune(self, code, geometry="contour"):
+        reference = self.reference.commune(code)
+        if reference is not None and geometry == "contour":
+            return reference["contour"]
+        departement = self.reference.departement(code_departement(code))
+        if code not in self.communes or departement is None:
+            return None
+        return {
+            "type": "Feature",
+            "properties": {"code": code, "nom": self.communes[code]},
+            "geometry": carre(departement["bbox"], code),
+        }
+
+    def route(self, path, query):
+        parts = [p for p in path.split("/") if p]
+        if parts == ["departements"]:
+            return self.reference.departements()
+        if len(parts) == 3 and parts[0] == "departements" and parts[2] == "communes":
+            codes = sorted(c for c in self.communes if code_departement(c) == parts[1])
+            features = [
+                self.commune(c, query.get("geometry", "contour")) for c in codes
+            ]
+            if query.get("format") == "geojson":
+                return {"type": "FeatureCollection", "features": features}
+            return [dict(f["properties"], codeDepartement=parts[1]) for f in features]
+        if len(parts) == 2 and parts[0] == "communes":
+            return self.commune(parts[1], query.get("geometry", "contour"))
+        return None
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api.requests += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                panne, api.pannes = api.pannes > 0, max(api.pannes - 1, 0)
+                if panne or random.random() < api.error_rate:
+                    self.reply(503, {"message": "stub error"})
+                    return
+                result = api.route(url.path, query)
+                if result is None:
+                    self.reply(404, {"message": "not found"})
+                else:
+                    self.reply(200, result)
+
+            def reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def serve(port=0, root=".", latency=0.0, error_rate=0.0):
+    api = StubGeoApi(root, latency=latency, error_rate=error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), api.handler())
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"geo API bouchon sur http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,118 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+# arbre de spans d'un rerun : chaque span note sa durée, le statut du cache
+# (hit / miss) et le nombre de lignes produites ; les arbres terminés sont
+# écrits dans le journal (JSON, une ligne par rerun, fichier TRACE_LOG) et
+# passés à `puits`
+
+logger = logging.getLogger("tdc.trace")
+
+TRACE_LOG = os.environ.get("TRACE_LOG")
+if TRACE_LOG and not logger.handlers:
+    _handler = logging.FileHandler(TRACE_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# fonction appelée avec chaque arbre terminé (affichage du panneau de profilage)
+puits = None
+
+_courant = contextvars.ContextVar("span", default=None)
+
+
+def lignes(resultat):
+    # nombre de lignes (DataFrame, liste, index) ou d'entités (GeoJSON)
+    if isinstance(resultat, dict):
+        resultat = resultat.get("features")
+    if resultat is None or isinstance(resultat, str):
+        return None
+    try:
+        return len(resultat)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def span(nom, racine=False, **attributs):
+    # hors d'un arbre, seul un span racine est enregistré
+    parent = _courant.get()
+    if parent is None and not racine:
+        yield {}
+        return
+    noeud = {"nom": nom, **attributs, "enfants": []}
+    if parent is not None:
+        parent["enfants"].append(noeud)
+    else:
+        noeud["debut"] = time.time()
+    jeton = _courant.set(noeud)
+    debut = time.perf_counter()
+    try:
+        yield noeud
+    finally:
+        noeud["ms"] = round((time.perf_counter() - debut) * 1000, 2)
+        _courant.reset(jeton)
+        if parent is None:
+            termine(noeud)
+
+
+def termine(arbre):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(arbre, default=str, ensure_ascii=False))
+    if puits is not None:
+        puits(arbre)
+
+
+def marque(**attributs):
+    noeud = _courant.get()
+    if noeud is not None:
+        noeud.update(attributs)
+
+
+def _mesure(fonction):
+    # exécution réelle, sous le cache : le span passe à « miss »
+    @functools.wraps(fonction)
+    def calcul(*args, **kwargs):
+        marque(cache="miss")
+        return fonction(*args, **kwargs)
+
+    return calcul
+
+
+def traced(nom=None, cache=None, racine=False):
+    # `cache` : décorateur de cache Streamlit (st.cache_data, st.cache_resource)
+    # appliqué sous le span ; le span est « miss » si la fonction est exécutée
+    def decorateur(fonction):
+        calcul = cache(_mesure(fonction)) if cache is not None else fonction
+
+        @functools.wraps(fonction)
+        def wrapper(*args, **kwargs):
+            with span(nom or fonction.__name__, racine=racine) as noeud:
+                if cache is not None:
+                    noeud["cache"] = "hit"
+                resultat = calcul(*args, **kwargs)
+                noeud["lignes"] = lignes(resultat)
+                return resultat
+
+        if cache is not None:
+            wrapper.clear = calcul.clear
+        return wrapper
+
+    return decorateur
+
+
+def aplatir(arbre, profondeur=0):
+    # une ligne par span, dans l'ordre d'exécution, pour un affichage tabulaire
+    yield {
+        "span": "  " * profondeur + arbre["nom"],
+        "ms": arbre.get("ms"),
+        "cache": arbre.get("cache"),
+        "lignes": arbre.get("lignes"),
+    }
+    for enfant in arbre["enfants"]:
+        yield from aplatir(enfant, profondeur + 1)